@@ -30,10 +30,18 @@
 # The code here was written by Simon Parsons, based on examples from
 # the PacMan AI projects.
 
+from collections import namedtuple
 from random import random
 from pacman import Directions
 import util
 
+# The array accessors (wallArray() and so on) need numpy. Everything
+# else works without it.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 #
 # Parameters
 #
@@ -58,6 +66,19 @@ nonDeterministic = True
 # Probability that Pacman carries out the intended action:
 directionProb = 0.8
 
+# Where makeMove gets its random numbers: the global random() unless
+# seedMoves has given Pacman a stream of his own.
+moveRandom = random
+
+def seedMoves(stream):
+    # Makes makeMove draw from stream (see randomStreams.py), or from the
+    # global random() again if stream is None.
+    global moveRandom
+    if stream is None:
+        moveRandom = random
+    else:
+        moveRandom = stream.random
+
 # 
 # Sensing
 #
@@ -69,6 +90,12 @@ def whereAmI(state):
 
     return state.getPacmanPosition()
 
+def whichWay(state):
+    # Returns the direction Pacman is facing: the way he last moved, or
+    # Directions.STOP before his first move. Stopping does not change it.
+
+    return state.getPacmanState().configuration.direction
+
 def legalActions(state):
     # Returns the legal set of actions
     #
@@ -83,8 +110,8 @@ def ghosts(state):
     # This version just returns the ghost positions from the state data
     # In later versions this will be more restricted, and include some
     # uncertainty.
-            
-    return union(visible(state.getGhostPositions(),state), audible(state.getGhostPositions(),state))
+
+    return list(observe(state).ghosts)
 
 def ghostStates(state):
     # Returns the position of the ghsosts, plus an indication of
@@ -97,25 +124,14 @@ def ghostStates(state):
     # where "state" is 1 if the relevant ghost is scared/edible, and 0
     # otherwise.
     
-    ghostStateInfo = state.getGhostStates()
-    ghostStates = []
-    for s in ghostStateInfo:
-        if s.scaredTimer > 0:
-            ghostStates.append((s.getPosition(), 1))
-        else:
-            ghostStates.append((s.getPosition(), 0))
-    return ghostStates
+    return list(observe(state).ghostStates)
 
 def ghostStatesWithTimes(state):
     # Just as ghostStates(), but when the ghost is in scared/edible
     # mode, "state" is a time value (how much longer the ghost will
     # remain scared/edible) rather than 1.
     
-    ghostStateInfo = state.getGhostStates()
-    ghostStates = []
-    for s in ghostStateInfo:
-        ghostStates.append((s.getPosition(), s.scaredTimer))
-    return ghostStates
+    return list(observe(state).ghostStatesWithTimes)
 
 def capsules(state):
     # Returns a list of (x, y) pairs of capsule positions.
@@ -132,8 +148,8 @@ def capsules(state):
     # 2) Pacman is not moving, and the capsule is within the visibilityLimit.
     #
     # In both cases, walls block the view.
-    
-    return visible(state.getCapsules(), state)
+
+    return list(observe(state).capsules)
 
 def food(state):
     # Returns a list of (x, y) pairs of food positions
@@ -151,17 +167,7 @@ def food(state):
     #
     # In both cases, walls block the view.
     
-    foodList= []
-    foodGrid = state.getFood()
-    width = foodGrid.width
-    height = foodGrid.height
-    for i in range(width):
-        for j in range(height):
-            if foodGrid[i][j] == True:
-                foodList.append((i, j))
-            
-    # Return list of food that is visible
-    return visible(foodList, state)
+    return list(observe(state).food)
 
 def walls(state):
     # Returns a list of (x, y) pairs of wall positions
@@ -169,31 +175,220 @@ def walls(state):
     # This version just returns all the current wall locations
     # extracted from the state data.  In later versions, this will be
     # restricted by distance, and include some uncertainty.
-    
-    wallList= []
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    for i in range(width):
-        for j in range(height):
-            if wallGrid[i][j] == True:
-                wallList.append((i, j))            
-    return wallList
+    #
+    # The list is worked out once per layout (see layoutWalls) and
+    # each call gets its own copy of it.
+
+    return list(layoutWalls(state)[0])
 
 def corners(state):
     # Returns the coordinates of the four corners of the state space.
     #
     # For harder exploration we could obfusticate this information.
 
-    corners=[]
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    corners.append((0, 0))
-    corners.append((width-1, 0))
-    corners.append((0, height-1))
-    corners.append((width-1, height-1))
-    return corners
+    return list(layoutWalls(state)[2])
+
+#
+# Layout cache
+#
+# The walls never change during a game, but the game gives agents a
+# fresh copy of the layout every move, so walls() used to go over the
+# whole grid, and inFront() over the whole wall list, on every call.
+# The wall list, the same positions as a set and the corners are now
+# worked out once and kept until a state with a different layout comes
+# along. The copies of a layout share the strings of its text, so
+# checking it is still the same layout is one comparison per row.
+#
+# The cache also holds the sight lines of the layout: for a square and
+# a direction, the squares Pacman would see looking that way from it,
+# up to the first wall. They are worked out the first time they are
+# needed, so inFront(), atSide() and visible() look corridors up rather
+# than walking them.
+
+_cachedLayoutText = None
+_cachedWalls = None
+
+def layoutWalls(state):
+    # Returns (wall tuple, wall set, corner tuple, sight lines) for the
+    # layout of state. These are shared, so they should not be changed.
+    global _cachedLayoutText, _cachedWalls
+
+    layoutText = state.data.layout.layoutText
+    if layoutText != _cachedLayoutText:
+        wallList = []
+        wallGrid = state.getWalls()
+        width = wallGrid.width
+        height = wallGrid.height
+        for i in range(width):
+            for j in range(height):
+                if wallGrid[i][j] == True:
+                    wallList.append((i, j))
+
+        corners = []
+        corners.append((0, 0))
+        corners.append((width-1, 0))
+        corners.append((0, height-1))
+        corners.append((width-1, height-1))
+
+        _cachedWalls = (tuple(wallList), frozenset(wallList), tuple(corners), {})
+        _cachedLayoutText = layoutText
+    return _cachedWalls
+
+# Which way each direction looks
+sightVectors = {Directions.NORTH: (0, 1),
+                Directions.SOUTH: (0, -1),
+                Directions.EAST: (1, 0),
+                Directions.WEST: (-1, 0)}
+
+def sightLine(position, facing, state):
+    # Returns the list of squares along the corridor from position in
+    # the direction facing, nearest first, up to the first wall. The
+    # n-th square in it is n squares from position.
+    wallList, wallSet, corners, sightLines = layoutWalls(state)
+    key = (position, facing)
+    if key not in sightLines:
+        dx, dy = sightVectors[facing]
+        line = []
+        next = (position[0] + dx, position[1] + dy)
+        while not next in wallSet:
+            line.append(next)
+            next = (next[0] + dx, next[1] + dy)
+        sightLines[key] = line
+    return sightLines[key]
+
+#
+# Snapshots
+#
+# An agent usually asks for the food, the capsules and the ghosts of the
+# same state one after the other. observe() works all of them out in one
+# go: a single pass over the food grid and a single visibility check
+# that every kind of object is filtered through. The snapshot of the
+# last state observed is kept, and food(), capsules(), ghosts(),
+# ghostStates() and ghostStatesWithTimes() return copies of its
+# contents, so calling several of them for one state costs one snapshot.
+
+# Everything Pacman can sense in a state. The fields hold what the
+# functions of the same names return (pacman is whereAmI(), legal is
+# legalActions()), as tuples.
+Observation = namedtuple("Observation", ["pacman", "legal", "walls", "corners", "food", "capsules",
+                                         "ghosts", "ghostStates", "ghostStatesWithTimes"])
+
+_lastObserved = None
+_lastObservation = None
+
+def observe(state):
+    # Returns an Observation of state.
+    global _lastObserved, _lastObservation
+
+    observed = observationKey(state)
+    if sameObservation(_lastObserved, observed):
+        return _lastObservation
+
+    wallTuple, wallSet, cornerTuple, sightLines = layoutWalls(state)
+    if partialVisibility:
+        squares = visibleSquares(state)
+    else:
+        squares = None
+
+    ghostPositions = state.getGhostPositions()
+    ghostStateInfo = state.getGhostStates()
+
+    _lastObservation = Observation(
+        pacman = state.getPacmanPosition(),
+        legal = tuple(state.getLegalPacmanActions()),
+        walls = wallTuple,
+        corners = cornerTuple,
+        food = tuple(seenOn(state.getFood().asList(), squares)),
+        capsules = tuple(seenOn(state.getCapsules(), squares)),
+        ghosts = tuple(union(seenOn(ghostPositions, squares), audible(ghostPositions, state))),
+        ghostStates = tuple((s.getPosition(), 1 if s.scaredTimer > 0 else 0) for s in ghostStateInfo),
+        ghostStatesWithTimes = tuple((s.getPosition(), s.scaredTimer) for s in ghostStateInfo))
+    _lastObserved = observed
+    return _lastObservation
+
+def observationKey(state):
+    # What a snapshot depends on. The limits are part of it in case they
+    # are changed between calls
+    return (state, partialVisibility, sideLimit, hearingLimit, visibilityLimit)
+
+def sameObservation(a, b):
+    return a is not None and a[0] is b[0] and a[1:] == b[1:]
+
+#
+# Arrays
+#
+# Boolean numpy arrays of what observe() reports, for agents that work
+# on whole grids at once. They are indexed [x, y], the same way as
+# game.Grid (and state.getWalls(), state.getFood()), so shape is
+# (width, height). The wall array is made once per layout, the others
+# once per state, and every call gets the same read-only array, so
+# asking again costs nothing. Use a copy to change one.
+
+_wallArrayFor = None
+_wallArray = None
+_arraysFor = None
+_arrays = {}
+
+def wallArray(state):
+    # True on walls
+    global _wallArrayFor, _wallArray
+
+    needNumpy()
+    cached = layoutWalls(state)
+    if cached is not _wallArrayFor:
+        _wallArray = readOnly(np.array(state.getWalls().data, dtype=bool))
+        _wallArrayFor = cached
+    return _wallArray
+
+def foodArray(state):
+    # True where food() reports food
+    def build():
+        if not partialVisibility:
+            return np.array(state.getFood().data, dtype=bool)
+        return positionArray(state, observe(state).food)
+    return snapshotArray(state, "food", build)
+
+def capsuleArray(state):
+    # True where capsules() reports a capsule
+    return snapshotArray(state, "capsules", lambda: positionArray(state, observe(state).capsules))
+
+def ghostArray(state):
+    # True where ghosts() reports a ghost. A ghost between two squares
+    # (scared ghosts move half a square at a time) marks both.
+    return snapshotArray(state, "ghosts", lambda: positionArray(state, observe(state).ghosts))
+
+def snapshotArray(state, name, build):
+    # The array called name for state, made with build() the first time
+    # it is asked for
+    global _arraysFor, _arrays
+
+    needNumpy()
+    observed = observationKey(state)
+    if not sameObservation(_arraysFor, observed):
+        _arrays = {}
+        _arraysFor = observed
+    if name not in _arrays:
+        _arrays[name] = readOnly(build())
+    return _arrays[name]
+
+def needNumpy():
+    # The array accessors are the only part of the api that uses numpy
+    if np is None:
+        raise ImportError("The api array accessors need numpy")
+
+def positionArray(state, positions):
+    # A (width, height) array that is True on the squares of positions
+    walls = state.getWalls()
+    array = np.zeros((walls.width, walls.height), dtype=bool)
+    if len(positions) > 0:
+        points = np.array(positions, dtype=float)
+        array[np.floor(points[:, 0]).astype(int), np.floor(points[:, 1]).astype(int)] = True
+        array[np.ceil(points[:, 0]).astype(int), np.ceil(points[:, 1]).astype(int)] = True
+    return array
+
+def readOnly(array):
+    array.flags.writeable = False
+    return array
                 
 #
 # Acting
@@ -220,7 +415,7 @@ def makeMove(direction, legal):
         # direction with probability directionProb.
         #
         # Otherwise make a different move.
-        sample = random()
+        sample = moveRandom()
         if sample <= directionProb:
             # Here the non-deterministic action selection says to
             # return the original move, but we need to check it is
@@ -261,59 +456,10 @@ def inFront(object, facing, state):
     # Returns true if the object is along the corridor in the
     # direction of the parameter "facing" before a wall gets in the
     # way.
-    
-    pacman = state.getPacmanPosition()
-    pacman_x = pacman[0]
-    pacman_y = pacman[1]
-    wallList = walls(state)
-
-    # If Pacman is facing North
-    if facing == Directions.NORTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y + 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] + 1)
-        return False
-
-    # If Pacman is facing South
-    if facing == Directions.SOUTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y - 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] - 1)
-        return False
 
-    # If Pacman is facing East
-    if facing == Directions.EAST:
-        # Check if the object is anywhere due East of Pacman before a
-        # wall intervenes.
-        next = (pacman_x + 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] + 1, pacman_y)
-        return False
-    
-    # If Pacman is facing West
-    if facing == Directions.WEST:
-        # Check if the object is anywhere due West of Pacman before a
-        # wall intervenes.
-        next = (pacman_x - 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] - 1, pacman_y)
+    if facing not in sightVectors:
         return False
+    return object in sightLine(state.getPacmanPosition(), facing, state)
 
 def atSide(object, facing, state):
     # Returns true if the object is in a side corridor perpendicular
@@ -353,30 +499,40 @@ def visible(objects, state):
 
     # This code creates partial observability by only returning some
     # of the members of objects.
-    facing = state.getPacmanState().configuration.direction
-    visibleObjects = []
-    sideObjects = []
-    
+    #
+    # If we return visibleObjects, we have partial observability. If
+    # we return objects, then we have full observability.
+    if not partialVisibility:
+        return objects
+    return seenOn(objects, visibleSquares(state))
+
+def visibleSquares(state):
+    # Returns a list of sets of the squares Pacman can see, in the order
+    # visible() lists the objects on them.
+    facing = whichWay(state)
+    pacman = state.getPacmanPosition()
+
+    # The squares along a corridor are in order of distance, so the
+    # first "limit" of them are the ones within "limit" of Pacman.
     if facing != Directions.STOP:
-    
+
         # If Pacman is moving, visible objects are those in front of,
         # and to the side (if there are any side corridors).
 
         # Objects in front. Visible up to "visibilityLimit"
-        for i in range(len(objects)):
-            if inFront(objects[i], facing, state):
-                visibleObjects.append(objects[i])
-        visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
-        
+        ahead = set(sightLine(pacman, facing, state)[:visibilityLimit])
+
         # Objects to the side. Visible up to "sideLimit"
-        for i in range(len(objects)):
-            if atSide(objects[i], facing, state):
-                sideObjects.append(objects[i])
-        sideObjects = distanceLimited(sideObjects, state, sideLimit)
-
-        # Combine lists.
-        visibleObjects = visibleObjects + sideObjects
-        
+        if facing == Directions.NORTH or facing == Directions.SOUTH:
+            sides = [Directions.WEST, Directions.EAST]
+        else:
+            sides = [Directions.NORTH, Directions.SOUTH]
+        side = set()
+        for direction in sides:
+            side.update(sightLine(pacman, direction, state)[:sideLimit])
+
+        return [ahead, side]
+
     else:
 
         # If Pacman is not moving, they can see in all directions.
@@ -385,23 +541,20 @@ def visible(objects, state):
         # after the first move is made, so this code will not run
         # after the first move :-(
 
-        for i in range(len(objects)):
-            if inFront(objects[i], Directions.NORTH, state):
-                visibleObjects.append(objects[i])
-            if inFront(objects[i], Directions.SOUTH, state):
-                visibleObjects.append(objects[i])
-            if inFront(objects[i], Directions.EAST, state):
-                visibleObjects.append(objects[i])
-            if inFront(objects[i], Directions.WEST, state):
-                visibleObjects.append(objects[i])
-        visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
+        around = set()
+        for direction in sightVectors:
+            around.update(sightLine(pacman, direction, state)[:visibilityLimit])
+        return [around]
 
-    # If we return visibleObjects, we have partial observability. If
-    # we return objects, then we have full observability.
-    if partialVisibility:
-        return visibleObjects
-    else:
+def seenOn(objects, squares):
+    # Returns the objects that are on one of the sets of squares from
+    # visibleSquares(), or all of them if squares is None.
+    if squares is None:
         return objects
+    seenObjects = []
+    for seen in squares:
+        seenObjects = seenObjects + [o for o in objects if o in seen]
+    return seenObjects
 
 def audible(ghosts, state):
     # A ghost is audible if it is any direction and less than
@@ -422,7 +575,7 @@ def selectNewMove(direction, legal):
 
     # Pick with 50% probability between the two perpendicular
     # possibilities.
-    sample = random()
+    sample = moveRandom()
     if sample <= 0.5:
         left = True
     else:
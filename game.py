@@ -583,6 +583,10 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
+            # Agents that want to plan within the time limits for a move
+            # are told what they are
+            if ("registerMoveTimeLimits" in dir(agent)):
+                agent.registerMoveTimeLimits(self.rules.getMoveWarningTime(i), self.rules.getMoveTimeout(i))
             if ("registerInitialState" in dir(agent)):
                 self.mute(i)
                 if self.catchExceptions:
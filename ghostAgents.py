@@ -20,15 +20,23 @@ from util import manhattanDistance
 import util
 
 class GhostAgent( Agent ):
+    # Where the ghost's moves are drawn from; the random module unless a
+    # stream is set with seedStream
+    stream = None
+
     def __init__( self, index ):
         self.index = index
 
+    def seedStream( self, stream ):
+        "Draws this ghost's moves from stream (see randomStreams.py), or from the random module if None"
+        self.stream = stream
+
     def getAction( self, state ):
         dist = self.getDistribution(state)
         if len(dist) == 0:
             return Directions.STOP
         else:
-            return util.chooseFromDistribution( dist )
+            return util.chooseFromDistribution( dist, self.stream )
 
     def getDistribution(self, state):
         "Returns a Counter encoding a distribution over actions from the provided state."
@@ -34,6 +34,27 @@ import api
 import random
 import game
 import util
+from valueMap import ValueMap
+from mdpPolicy import Policy, KEYS, ACTIONS, DIRECTIONS
+import mdpCache
+import time
+
+# The array solvers need numpy. Without it only the dictionary solver
+# is available.
+try:
+	import numpy as np
+	import mdpSolver
+	import mdpParallel
+	import mdpTables
+	import mdpGhosts
+	import mdpBelief
+except ImportError:
+	np = None
+	mdpSolver = None
+	mdpParallel = None
+	mdpTables = None
+	mdpGhosts = None
+	mdpBelief = None
 
 class Grid:
 
@@ -82,6 +103,14 @@ class Grid:
 			print
 		print
 
+# Share of the game's time limit for a move that the solve may use. The rest
+# is left for building the value map, printing, and the machine being slow.
+BUDGET_FRACTION = 0.5
+
+# Under partialVisibility, squares where at least this many ghosts are
+# expected are treated as ghost squares
+MIN_OCCUPANCY = 0.2
+
 class MDPAgent(Agent):
 	"""
 	The MDP Agent is one that calculates utilities for the map and for pacman's location
@@ -91,21 +120,150 @@ class MDPAgent(Agent):
 	(i.e. recalculates using valueIteration)
 	Number of loops in valueIteration depends on map size for efficiency. The smaller the map is,
 	the lower the number of loops required.
+
+	The solver can be picked with -a solver=...:
+	dict - the original loops over the valueMap (default)
+	vi   - value iteration on numpy arrays (see mdpSolver.py). It does the
+	       textbook Bellman backup, which dict does not quite do, so on
+	       close calls it can pick a different move from dict
+	ps   - prioritized sweeping: in-place backups ordered by Bellman error,
+	       starting from the squares whose rewards changed
+	pi   - policy iteration, evaluating each policy exactly with a sparse
+	       linear solve
+	inc  - vi that, after the first move, only re-sweeps the region around
+	       the squares whose rewards changed (moved ghosts, eaten food)
+	mg   - multigrid: solves a coarsened copy of the layout first and uses
+	       it as the starting point for vi
+	cg   - vi on the corridor graph: only junctions and dead ends are swept,
+	       corridors between them are solved in one go
+	par  - vi split into vertical strips, each swept by its own worker
+	       process (-a workers=..., by default one per CPU). Only worth it
+	       on very large layouts (see mdpParallel.py)
+	ghost - vi over pairs of pacman's square and the nearest ghost's square and
+	       heading, with the ghost moving as RandomGhost does, or as
+	       DirectionalGhost with -a attack=0.8 (see mdpGhosts.py). A scared
+	       ghost is worth eating until its timer runs out, and capsules are
+	       worth the chase they start. On layouts without ghosts it does
+	       what vi does
+	table - no solving at all: each move is looked up in an exact policy
+	       worked out offline by mdpTables.py (-a table=<name>). Only for
+	       small layouts without ghosts
+
+	Value iteration stops when the largest change in a sweep falls below
+	epsilon * (1 - gamma) / gamma (-a epsilon=...), or after maxIterations sweeps
+	(-a maxIterations=...; by default 200 on large maps and 100 on small ones).
+	Each move starts from the utilities of the previous one, since only a few
+	rewards change between moves (-a warm=0 starts from the raw rewards instead).
+
+	Each move also has a wall-clock budget for the solve: BUDGET_FRACTION of the
+	game's move time limit, which the game passes in through
+	registerMoveTimeLimits, or -a budget=... seconds. Once it runs out the solver
+	stops after its current sweep and the move is made from the utilities so far.
+	The sweeps and residual (largest change another sweep would make) of every
+	move are printed.
+
+	With -a cache=<directory>, converged utilities are kept on disk (at most
+	-a cacheSize=... of them) and reused whenever the same food, ghosts and
+	settings come up again, in this game, a later one, or a later run.
+
+	With api.partialVisibility on, the ghosts that are out of sight are tracked
+	(see mdpBelief.py, -a track=0 turns it off) and every square where a ghost is
+	expected to be gets -10 times the number of ghosts expected there.
+
+	The greedy policy for the last move's utilities is kept in self.policy
+	(see mdpPolicy.py); self.policy.toArray() gives the best move from every
+	square.
 	"""
 	# Constructor: this gets run when we first invoke pacman.py
-	def __init__(self):
+	def __init__(self, solver="dict", epsilon=0.001, maxIterations=None, warm=True, workers=None, budget=None,
+				cache=None, cacheSize=1000, table=None, attack=0, track=True):
 		print "Starting up MDPAgent!"
 		name = "Pacman"
 
+		if solver not in ("dict", "vi", "ps", "pi", "inc", "mg", "cg", "par", "ghost", "table"):
+			raise ValueError("Unknown solver: " + str(solver))
+		if solver != "dict" and mdpSolver is None:
+			raise ImportError("The " + solver + " solver needs numpy")
+		if solver == "table" and table is None:
+			raise ValueError("The table solver needs a table: -a table=<name>")
+		self.solver = solver
+		# Name of the policy table for the table solver, and the food left
+		# as a mask of the table's pellets (see mdpTables.py)
+		self.tableName = table
+		self.table = None
+		self.foodMask = None
+		# For the ghost solver: how likely the ghosts are to head for pacman,
+		# their positions on the last move, the last joint utilities and the
+		# utilities of eating a capsule
+		self.attack = float(attack)
+		self.lastGhosts = None
+		self.lastJointV = None
+		self.capsuleValues = None
+
+		# Convergence settings for value iteration. These arrive as strings
+		# when they are given on the command line
+		self.epsilon = float(epsilon)
+		if maxIterations is None:
+			self.maxIterations = None
+		else:
+			self.maxIterations = int(maxIterations)
+		# Number of sweeps and backups the last solve needed, how far from
+		# converged it stopped and how long it took
+		self.sweeps = 0
+		self.backups = 0
+		self.residual = None
+		self.solveTime = 0.0
+
+		# Time budget for each move's solve in seconds. One given with
+		# -a budget=... wins over the one worked out from the game's limits
+		if budget is None:
+			self.budget = None
+		else:
+			self.budget = float(budget)
+		self.ruleBudget = None
+		# time.time() at which the current move's solve has to stop
+		self.deadline = None
+
+		# Cache of converged utilities, kept in the directory given with
+		# -a cache=... (see mdpCache.py)
+		if cache is None:
+			self.cache = None
+		else:
+			self.cache = mdpCache.SolutionCache(cache, int(cacheSize))
+		self.fingerprint = None
+
+		# Warm start: keep the utilities from the last move to start the next
+		# solve from
+		self.warm = str(warm).lower() not in ("0", "false", "no")
+
+		# Ghost tracking under partialVisibility
+		self.track = str(track).lower() not in ("0", "false", "no")
+		self.tracker = None
+
+		# Number of worker processes for the par solver
+		if workers is None:
+			self.workers = None
+		else:
+			self.workers = int(workers)
+		self.lastValueMap = None
+		self.lastV = None
+		self.lastFrozen = None
+		# Greedy policy for the last move's utilities
+		self.policy = None
+
 		# Store permanent values
-		# These lists store values that remain more or less static throughout
-		# the entire game (with the exception of coordinates moving from capsules/foodMap to visited)
-		self.visited = []
-		self.foodMap = []
+		# These store values that remain more or less static throughout the entire game
+		# rewardMap holds the value of every square without the ghosts (see updateRewardMap)
 		self.wallMap = []
-		self.capsuleMap = []
+		self.rewardMap = None
 
 
+	# Gets run by the game before registerInitialState with the time limits
+	# for a move: a move taking longer than warningTime seconds gets a warning,
+	# one taking longer than timeout loses the game
+	def registerMoveTimeLimits(self, warningTime, timeout):
+		self.ruleBudget = BUDGET_FRACTION * min(warningTime, timeout)
+
 	# Gets run after an MDPAgent object is created and once there is
 	# game state to access.
 	def registerInitialState(self, state):
@@ -118,14 +276,80 @@ class MDPAgent(Agent):
 		self.addWallsToMap(state)
 		self.map.display()
 
+		if self.cache is not None:
+			self.fingerprint = mdpCache.layoutFingerprint(self.map.getWidth(), self.map.getHeight(), api.walls(state))
+
+		# The table solver just checks that its table is for this game
+		if self.solver == "table":
+			self.startTable(state)
+			return
+
+		# The array solvers work from a transition table for the layout.
+		# It is only built the first time a layout is seen
+		if self.solver != "dict":
+			self.model = mdpSolver.getLayoutModel(api.walls(state), self.map.getWidth(), self.map.getHeight())
+		# The par solver's worker processes are started once per layout too
+		if self.solver == "par":
+			self.parallel = mdpParallel.getParallelSolver(self.model, self.workers)
+		# So are the ghost solver's ghost transitions
+		if self.solver == "ghost":
+			self.ghostModel = mdpGhosts.getGhostModel(self.model, self.attack)
+			print "ghost model:", self.ghostModel.memoryReport()
+			self.lastGhosts = None
+			self.lastJointV = None
+			self.capsuleValues = None
+
+		self.rewardMap = None
+		self.lastValueMap = None
+		self.lastV = None
+		self.lastFrozen = None
+
+		# Under partialVisibility the ghosts are tracked from where they start
+		self.tracker = None
+		if self.track and api.partialVisibility and mdpBelief is not None:
+			model = mdpSolver.getLayoutModel(api.walls(state), self.map.getWidth(), self.map.getHeight())
+			ghostModel = mdpGhosts.getGhostModel(model, self.attack)
+			self.tracker = mdpBelief.BeliefTracker(ghostModel, [position for (position, scared) in api.ghostStates(state)])
+
+	# Loads the policy table and checks it was made for this layout: the
+	# same walls, no ghosts and (when all the food can be seen) the same
+	# food. Every pellet starts out uneaten.
+	def startTable(self, state):
+		self.table = mdpTables.getPolicyTable(self.tableName)
+		fingerprint = mdpCache.layoutFingerprint(self.map.getWidth(), self.map.getHeight(), api.walls(state))
+		if fingerprint != self.table.fingerprint:
+			raise Exception("The table " + self.tableName + " is for a different layout")
+		if len(api.ghostStates(state)) > 0:
+			raise Exception("Policy tables are only for layouts without ghosts")
+		if not api.partialVisibility and set(api.food(state)) != set(self.table.food):
+			raise Exception("The table " + self.tableName + " is for different food")
+		self.foodMask = self.table.fullMask()
+
+	# The table solver's move: clear the pellet pacman is on from the mask
+	# and look up the move for the food that is left
+	def getTableAction(self, state):
+		legal = api.legalActions(state)
+		pacman = api.whereAmI(state)
+		self.foodMask = self.table.eat(self.foodMask, pacman)
+		return api.makeMove(self.table.actionFor(pacman, self.foodMask), legal)
+
 	# This is what gets run in between multiple games
 	def final(self, state):
 		print "Looks like the game just ended!"
+		if self.cache is not None:
+			print "cache:", self.cache.summary()
 
-		self.visited = []
-		self.foodMap = []
 		self.wallMap = []
-		self.capsuleMap = []
+		self.rewardMap = None
+		self.lastValueMap = None
+		self.lastV = None
+		self.lastFrozen = None
+		self.policy = None
+		self.foodMask = None
+		self.tracker = None
+		self.lastGhosts = None
+		self.lastJointV = None
+		self.capsuleValues = None
 
 
 	# Make a map of a grid
@@ -156,190 +380,117 @@ class MDPAgent(Agent):
 			self.map.setValue(walls[i][0], walls[i][1], "#")
 
 	def makeValueMap(self, state):
-		# This function returns a dictionary of all possible coordinates on a grid
+		# This function returns a ValueMap of all possible coordinates on a grid
 		# As well as all the values that are assigned to each coordinate-category
 		# Food is given a value of 5
 		# Empty spaces are given a value of 0
 		# Capsules are given a value of 5
+		# Ghosts are given a value of -10
 
+		# The values of everything but the ghosts are kept from move to move
+		# in rewardMap, and only the squares that changed are updated
+		self.updateRewardMap(state)
+		valueMap = self.rewardMap.copy()
 
-		food = api.food(state)
-		walls = api.walls(state)
-		capsules = api.capsules(state)
-		pacman = api.whereAmI(state)
-		corners = api.corners(state)
-
-		# If pacman's location has not been recorded in a list of visited locations
-		# Record it
-		if pacman not in self.visited:
-			self.visited.append(pacman)
-
-		# Up
-		for i in food:
-			if i not in self.foodMap:
-				self.foodMap.append(i)
-
-		for i in walls:
-			if i not in self.wallMap:
-				self.wallMap.append(i)
-
-		for i in capsules:
-			if i not in self.capsuleMap:
-				self.capsuleMap.append(i)
-
-
-		# Create a dictionary storing all
-		# Food, wall and capsule locations, while assigning values to them
-		self.foodDict = dict.fromkeys(self.foodMap, 5)
-		self.wallDict = dict.fromkeys(self.wallMap, '#')
-		self.capsuleDict = dict.fromkeys(self.capsuleMap, 5)
-
-		# Initiate valueMap to store all coordinates
-		valueMap = {}
-		valueMap.update(self.foodDict)
-		valueMap.update(self.wallDict)
-		valueMap.update(self.capsuleDict)
-
-		# Using the APIs to get coordinates tends to leave out pacman
-		# Initial position
-		# This will sweep through all available coordinates
-		# And add the square to the list with 0
-
-		for i in range(self.getLayoutWidth(corners) - 1):
-			for j in range(self.getLayoutHeight(corners) - 1):
-				if (i, j) not in valueMap.keys():
-					valueMap[(i, j)] = 0
-
-		# Update function. If pacman has been seen to visit a square
-		# It means he has eaten the food or capsules there
-		# Thus, set their values to 0
-		for i in self.foodMap:
-			if i in self.visited:
-				valueMap[i] = 0
-
-		for i in self.capsuleMap:
-			if i in self.visited:
-				valueMap[i] = 0
+		# Ghosts that are being tracked are spread over the squares they may be on
+		if self.tracker is not None:
+			for (square, expected) in self.tracker.likelySquares(MIN_OCCUPANCY):
+				valueMap[square] = -10 * min(1.0, expected)
+			return valueMap
 
 		# Another update function
 		# Updates the location of the ghost
 		ghosts = api.ghosts(state)
 		ghostStates = api.ghostStatesWithTimes(state)
 
-		for i in valueMap.keys():
-			for j in range(len(ghosts)):
-				ghostTime = ghostStates[j][1]
-				#Convert coordinates to int (keys are stored as int, but coordinates from API are stored as float)
-				if ((int(ghosts[j][0])), (int(ghosts[j][1]))) == i:
-					valueMap[i] = -10
-				#elif ((int(ghosts[j][0])), (int(ghosts[j][1]))) == i and ghostTime >= 5:
-				#	valueMap[i] = 5
+		for j in range(len(ghosts)):
+			ghostTime = ghostStates[j][1]
+			#Convert coordinates to int (squares are indexed by int, but coordinates from API are stored as float)
+			ghost = ((int(ghosts[j][0])), (int(ghosts[j][1])))
+			if ghost in valueMap and not valueMap.isWall(ghost[0], ghost[1]):
+				valueMap[ghost] = -10
+			#elif ghostTime >= 5:
+			#	valueMap[ghost] = 5
 
 		return valueMap
 
 
+	def updateRewardMap(self, state):
+		# Brings rewardMap up to date with the state
+		# On the first move of a game the map is made from all the walls, food and capsules
+		# After that, food and capsules only disappear when pacman eats them, on the square
+		# he has just moved to, so that is the only square that needs changing.
+		# (GameStateData also records the food and capsule eaten, but every ghost move makes
+		# a new GameStateData without them, so they are usually gone by pacman's turn)
+		pacman = api.whereAmI(state)
+		pacman = (int(pacman[0]), int(pacman[1]))
+
+		if self.rewardMap is None:
+			corners = api.corners(state)
+			self.wallMap = api.walls(state)
+			self.rewardMap = ValueMap(self.getLayoutWidth(corners), self.getLayoutHeight(corners), self.wallMap)
+			self.addFoodToRewardMap(state)
+
+		# With partialVisibility pacman only sees the food and capsules near him, so
+		# anything that has come into view is added. Without it everything was seen
+		# on the first move
+		elif api.partialVisibility:
+			self.addFoodToRewardMap(state)
+
+		# Whatever was on pacman's square has been eaten
+		# Thus, set its value to 0
+		self.rewardMap[pacman] = 0
+
+	def addFoodToRewardMap(self, state):
+		# Food and capsules that can be seen have not been eaten yet, so they are given their value
+		for i in api.food(state):
+			self.rewardMap[i] = 5
+
+		for i in api.capsules(state):
+			self.rewardMap[i] = 5
+
 	def getTransition(self, x, y, valueMap):
 		# This function calculates the maximum expected utility of a coordinate on the initiated valueMap
 		# An sets the value of the coordinate to the MEU
 		# Which will then later be used as the transition value during value iteration
 
-		# initialise a dictionary to store utility values
-		self.util_dict = {"n_util": 0.0, "s_util": 0.0, "e_util": 0.0, "w_util": 0.0}
-		# valueMap should be a dictionary containing a list of values assigned to every grid
+		# valueMap should be a ValueMap holding the values assigned to every grid
 		self.valueMap = valueMap
 
 		self.x = x
 		self.y = y
 
-		north = (self.x, self.y + 1)
-		south = (self.x, self.y - 1)
-		east = (self.x + 1, self.y)
-		west = (self.x - 1, self.y)
-		stay = (self.x, self.y)
-
-
-		# If North is not a wall, then multiply expected utility;
-		# else multiply expected utility of staying in place
-		# If the perpendicular directions are not walls, then multiply expected utility of those
-		# else multiply expected utility of just staying in place
-
-		if self.valueMap[north] != "#":
-			n_util = (0.8 * self.valueMap[north])
-		else:
-			n_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[east] != "#":
-			n_util += (0.1 * self.valueMap[east])
-		else:
-			n_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			n_util += (0.1 * self.valueMap[west])
-		else:
-			n_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["n_util"] = n_util
-
-
-		# Repeat for the rest of the directions
-		if self.valueMap[south] != "#":
-			s_util = (0.8 * self.valueMap[south])
-		else:
-			s_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[east] != "#":
-			s_util += (0.1 * self.valueMap[east])
-		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			s_util += (0.1 * self.valueMap[west])
-		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["s_util"] = s_util
-
-
-		if self.valueMap[east] != "#":
-			e_util = (0.8 * self.valueMap[east])
-		else:
-			e_util = (0.8 * self.valueMap[stay])
+		self.util_dict = self.getExpectedUtilities(valueMap, x, y)
 
-		if self.valueMap[north] != "#":
-			e_util += (0.1 * self.valueMap[north])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[south] != "#":
-			e_util += (0.1 * self.valueMap[south])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["e_util"] = e_util
-
-		if self.valueMap[west] != "#":
-			w_util = (0.8 * self.valueMap[west])
-		else:
-			w_util = (0.8 * self.valueMap[stay])
+		# Take the max value in the dictionary of stored utilities
+		# Assign current grid MEU
+		# Return updated valueMap that has transition values
+		stay = valueMap.indexOf(x, y)
+		valueMap.values[stay] = max(self.util_dict.values())
 
-		if self.valueMap[north] != "#":
-			w_util += (0.1 * self.valueMap[north])
-		else:
-			w_util += (0.1 * self.valueMap[stay])
+		return valueMap.values[stay]
 
-		if self.valueMap[south] != "#":
-			w_util += (0.1 * self.valueMap[south])
-		else:
-			w_util += (0.1 * self.valueMap[stay])
+	def getTransitionAt(self, i, valueMap):
+		# Same as getTransition, for the square with index i in valueMap
+		self.util_dict = self.getExpectedUtilitiesAt(valueMap, i)
+		valueMap.values[i] = max(self.util_dict.values())
+		return valueMap.values[i]
 
-		self.util_dict["w_util"] = w_util
+	def getExpectedUtilities(self, valueMap, x, y):
+		# Returns a dictionary with the expected utility of moving in each direction from (x, y)
+		return self.getExpectedUtilitiesAt(valueMap, valueMap.indexOf(x, y))
 
-		# Take the max value in the dictionary of stored utilities
-		# Assign current grid MEU
-		# Return updated valueMap that has transition values
-		self.valueMap[stay] = max(self.util_dict.values())
+	def getExpectedUtilitiesAt(self, valueMap, i):
+		# Pacman goes the intended way with probability 0.8 and slips to either side with 0.1
+		# The neighbour table of the valueMap already has moves into walls replaced by
+		# staying in place, so the utilities are read straight from its flat array
+		values = valueMap.values
+		north, south, east, west = valueMap.neighbours[i]
 
-		return self.valueMap[stay]
+		return {"n_util": 0.8 * values[north] + 0.1 * values[east] + 0.1 * values[west],
+				"s_util": 0.8 * values[south] + 0.1 * values[east] + 0.1 * values[west],
+				"e_util": 0.8 * values[east] + 0.1 * values[north] + 0.1 * values[south],
+				"w_util": 0.8 * values[west] + 0.1 * values[north] + 0.1 * values[south]}
 
 
 	def valueIteration(self, state, reward, gamma, V1):
@@ -349,37 +500,32 @@ class MDPAgent(Agent):
 		# V1 = valueMap initialised with values for every element in the map
 		# Where food = 5, ghost = -10, capsules = 5
 
-		corners = api.corners(state)
 		walls = api.walls(state)
 		food = api.food(state)
-		ghosts = api.ghosts(state)
+		ghosts = self.getGhosts(state)
 		capsules = api.capsules(state)
 
-		#Get max width and height
-		maxWidth = self.getLayoutWidth(corners) - 1
-		maxHeight = self.getLayoutHeight(corners) - 1
-
 		# Create a list of buffer coordinates within 3 squares NSEW of ghosts to calculate
 		# value iteration around the ghosts (otherwise, food taken to be terminal value)
 		# will not have negative utilities - meaning pacman will still go for those food
 		# if a ghost is near by
 		# This does not work in small maps due to the virtue of those maps being far too small
 		# making this function redundant for them
-		foodToCalculate = []
+		foodToCalculate = set()
 		for i in range(5):
 			for x in range(len(ghosts)):
-				# Append coordinates 5 squares east to ghost
+				# Add coordinates 5 squares east to ghost
 				if (int(ghosts[x][0] + i), int(ghosts[x][1])) not in foodToCalculate:
-					foodToCalculate.append((int(ghosts[x][0] + i), int(ghosts[x][1])))
-				# Append coordinates 5 squares west to ghost
+					foodToCalculate.add((int(ghosts[x][0] + i), int(ghosts[x][1])))
+				# Add coordinates 5 squares west to ghost
 				if (int(ghosts[x][0] - i), int(ghosts[x][1])) not in foodToCalculate:
-					foodToCalculate.append((int(ghosts[x][0] - i), int(ghosts[x][1])))
-				# Append coordinates 5 squares north to ghost
+					foodToCalculate.add((int(ghosts[x][0] - i), int(ghosts[x][1])))
+				# Add coordinates 5 squares north to ghost
 				if (int(ghosts[x][0]), int(ghosts[x][1] + 1)) not in foodToCalculate:
-					foodToCalculate.append((int(ghosts[x][0]), int(ghosts[x][1] + i)))
-				# Append coordinates 5 squares south to ghost
+					foodToCalculate.add((int(ghosts[x][0]), int(ghosts[x][1] + i)))
+				# Add coordinates 5 squares south to ghost
 				if (int(ghosts[x][0]), int(ghosts[x][1] - 1)) not in foodToCalculate:
-					foodToCalculate.append((int(ghosts[x][0]), int(ghosts[x][1] - i)))
+					foodToCalculate.add((int(ghosts[x][0]), int(ghosts[x][1] - i)))
 
 
 		# A list of coordinates that should not be calculated
@@ -396,158 +542,303 @@ class MDPAgent(Agent):
 		if not (0 < gamma <= 1):
 			raise ValueError("MDP must have a gamma between 0 and 1.")
 
-		# Implement Bellman equation with _-loop iteration
-		loops = 200
-		while loops > 0:
-			V = V1.copy() # This will store the old values
-			for i in range(maxWidth):
-				for j in range(maxHeight):
-					# Exclude any food because in this case it is the terminal state
-					# Except for food that are within 5 squares north/south/east/west of the ghost
-					if (i, j) not in walls and (i, j) not in doNotCalculate and (i, j) not in ghosts and (i, j) not in capsules:
-						V1[(i, j)] = reward + gamma * self.getTransition(i, j, V)
-			loops -= 1
+		# Implement Bellman equation, iterating until the utilities converge
+		# (at most 200 loops unless maxIterations says otherwise)
+		loops = self.getMaxIterations(200)
+		frozen = walls + doNotCalculate + ghosts + capsules
+		return self.solve(state, reward, gamma, V1, frozen, ghosts, loops)
 
 	def valueIterationSmall(self, state, reward, gamma, V1):
 		# Similar to valueIteration function
 		# does not calculate buffers around ghosts (cause it would be too small)
 		# meant for maps smaller than 10 x 10
 
-		corners = api.corners(state)
 		walls = api.walls(state)
 		food = api.food(state)
-		ghosts = api.ghosts(state)
+		ghosts = self.getGhosts(state)
 		capsules = api.capsules(state)
 
-		maxWidth = self.getLayoutWidth(corners) - 1
-		maxHeight = self.getLayoutHeight(corners) - 1
-
 		if not (0 < gamma <= 1):
 			raise ValueError("MDP must have a gamma between 0 and 1.")
 
-		# Implement Bellman equation with 10-loop iteration
+		# Implement Bellman equation, iterating until the utilities converge
 		# Since smaller maps do not require as big of a value iteration loop
-		loops = 100
-		while loops > 0:
-			V = V1.copy() # This will store the old values
-			for i in range(maxWidth):
-				for j in range(maxHeight):
-					# Exclude any food because in this case it is the terminal state
-					if (i, j) not in walls and (i, j) not in food and (i, j) not in ghosts and (i, j) not in capsules:
-						V1[(i, j)] = reward + gamma * self.getTransition(i, j, V)
-			loops -= 1
-
-
-	def getPolicy(self, state, iteratedMap):
-		# gets movement policy for pacman's location at a given state
-		# using valueiteration map that is updated at every step
-
-		pacman = api.whereAmI(state)
-
-		# put in a valueMap that has been run across valueIteration (otherwise)
-		# a proper policy would not be able to be retrieved
-		self.valueMap = iteratedMap
-
-		# get pacman locations
-		x = pacman[0]
-		y = pacman[1]
-
-		# initialise dictionaries to hold expected utilities
-		self.util_dict = {"n_util": 0.0, "s_util": 0.0, "e_util": 0.0, "w_util": 0.0}
-
-		corners = api.corners(state)
-		maxWidth = self.getLayoutWidth(corners) - 1
-		maxHeight = self.getLayoutHeight(corners) - 1
-
-		# get directions relative to pacman's location
-		north = (x, y + 1)
-		south = (x, y - 1)
-		east = (x + 1, y)
-		west = (x - 1, y)
-		stay = (x, y)
-
-		# If North is not a wall, then multiply expected utility;
-		# else multiply expected utility of staying in place
-		# If the perpendicular directions are not walls, then multiply expected utility of those
-		# else multiply expected utility of just staying in place
-
-		if self.valueMap[north] != "#":
-			n_util = (0.8 * self.valueMap[north])
+		# at most 100 loops are run unless maxIterations says otherwise
+		loops = self.getMaxIterations(100)
+		frozen = walls + food + ghosts + capsules
+		return self.solve(state, reward, gamma, V1, frozen, ghosts, loops)
+
+	def getGhosts(self, state):
+		# The squares the solvers treat as ghosts: where the ghosts are seen or
+		# heard, or, when they are being tracked, where they may well be
+		if self.tracker is not None:
+			return [square for (square, expected) in self.tracker.likelySquares(MIN_OCCUPANCY)]
+		return api.ghosts(state)
+
+	def solve(self, state, reward, gamma, V1, frozen, ghosts, loops):
+		# Runs the chosen solver on V1 once valueIteration or valueIterationSmall
+		# has worked out which squares are frozen
+		# With a cache (-a cache=...), a problem that has been solved before starts
+		# from the cached utilities, so the solver only has to check them with one
+		# sweep. Utilities that converge are added to the cache
+		# Tracked ghosts are not on whole squares with whole values, so their
+		# solves are not cached
+		key = None
+		cached = None
+		if self.cache is not None and self.tracker is None:
+			food = [value == 5 for value in self.rewardMap.values]
+			settings = (self.solver, reward, gamma, self.epsilon)
+			key = mdpCache.makeKey(self.fingerprint, food, V1.mask(frozen), ghosts, settings)
+			cached = self.cache.get(key)
+
+		if cached is not None:
+			V1.values[:] = cached
 		else:
-			n_util = (0.8 * self.valueMap[stay])
+			self.warmStart(V1, frozen)
 
-		if self.valueMap[east] != "#":
-			n_util += (0.1 * self.valueMap[east])
+		if self.solver != "dict":
+			sweeps, backups = self.vectorValueIteration(state, reward, gamma, V1, frozen, loops)
 		else:
-			n_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			n_util += (0.1 * self.valueMap[west])
+			sweeps, backups = self.dictValueIteration(reward, gamma, V1, frozen, loops)
+
+		if key is not None and cached is None and self.residual < self.getConvergenceThreshold(gamma):
+			self.cache.put(key, V1.values)
+		return sweeps, backups
+
+	def dictValueIteration(self, reward, gamma, V1, frozen, loops):
+		# The dict solver's sweeps for valueIteration and valueIterationSmall
+		# frozen = list of coordinates that keep their value (walls, terminal food,
+		# ghosts and capsules)
+		# Whether a square is frozen only changes between moves, so it is worked
+		# out once here rather than with list lookups for every square in every sweep.
+		# The squares left are swept in the same order as before (column by column)
+		frozenMask = V1.mask(frozen)
+		update = [i for i in V1.cells if not frozenMask[i]]
+
+		threshold = self.getConvergenceThreshold(gamma)
+		values = V1.values
+		sweeps = 0
+		backups = 0
+		residual = float("inf")
+		while sweeps < loops and residual >= threshold and not self.outOfTime():
+			V = V1.copy() # This will store the old values
+			residual = 0
+			for i in update:
+				newValue = reward + gamma * self.getTransitionAt(i, V)
+				# V1 still holds the previous sweep's value for this square
+				residual = max(residual, abs(newValue - values[i]))
+				values[i] = newValue
+			backups += len(update)
+			sweeps += 1
+		self.residual = residual
+		return sweeps, backups
+
+	def outOfTime(self):
+		# True once this move's time budget has run out
+		return self.deadline is not None and time.time() >= self.deadline
+
+	def warmStart(self, V1, frozen):
+		# Seeds V1 with the utilities the previous move converged to.
+		# Only the squares that value iteration updates are seeded: frozen
+		# squares (walls, terminal food, ghosts, capsules) keep the rewards
+		# makeValueMap just gave them, so eaten food and moved ghosts are
+		# picked up. Value iteration reaches the same utilities from any
+		# starting point, just in fewer sweeps from a close one.
+		if not self.warm or self.lastValueMap is None:
+			return
+
+		frozen = V1.mask(frozen)
+		last = self.lastValueMap.values
+		for i in V1.cells:
+			if not frozen[i]:
+				V1.values[i] = last[i]
+
+	def getMaxIterations(self, default):
+		# Cap on the number of sweeps; the map-size dependent default
+		# unless one was given with -a maxIterations=...
+		if self.maxIterations is None:
+			return default
+		return self.maxIterations
+
+	def getBudget(self):
+		# Seconds each move's solve may take; None for no limit
+		if self.budget is not None:
+			return self.budget
+		return self.ruleBudget
+
+	def getConvergenceThreshold(self, gamma):
+		# Stop sweeping once no utility changes by more than this.
+		# epsilon * (1 - gamma) / gamma guarantees the utilities are within
+		# epsilon of the converged ones
+		return self.epsilon * (1 - gamma) / gamma
+
+	def vectorValueIteration(self, state, reward, gamma, V1, frozen, loops):
+		# Solves the same MDP as valueIteration/valueIterationSmall, but on numpy
+		# arrays using the layout's transition table (see mdpSolver.py).
+		# vi does full sweeps, each a handful of whole-array operations instead
+		# of a getTransition call per square.
+		# ps does single-square backups in order of Bellman error, starting from
+		# the squares that changed since the last move.
+		# pi does policy iteration; "sweeps" then counts its rounds of exact
+		# evaluation followed by a greedy backup of every square.
+		# inc does sweeps over the region around the squares that changed since
+		# the last move, falling back to vi for the first move.
+		# mg does vi starting from the solution of coarser versions of the layout.
+		# cg sweeps only the junctions and dead ends of the layout and solves the
+		# corridors between them exactly.
+		# par does the same sweeps as vi, split between worker processes.
+		# frozen = list of coordinates that keep their value (walls, terminal food,
+		# ghosts and capsules)
+		# loops = maximum number of sweeps (for ps, loops times the number of
+		# squares is the cap on backups)
+		# Results are written back into V1 so getPolicy works as before.
+		# Returns the number of sweeps (None for ps) and backups done
+
+		V = self.model.fromValueMap(V1)
+		frozenMask = self.model.cellMask(frozen)
+
+		# Squares whose reward or frozen status changed since the last solve.
+		# None when there is no previous solve to start from
+		changed = None
+		if self.warm and self.lastV is not None:
+			changed = (V != self.lastV) | (frozenMask != self.lastFrozen)
+
+		if self.solver == "ps":
+			# Without a previous solve every square is queued
+			maxBackups = loops * self.model.size()
+			V, backups = mdpSolver.prioritizedSweeping(self.model, V, frozenMask, reward, gamma, self.epsilon, maxBackups, changed, self.deadline)
+			sweeps = None
+		elif self.solver == "inc" and changed is not None:
+			V, sweeps, backups = mdpSolver.incrementalValueIteration(self.model, V, frozenMask, reward, gamma, self.epsilon, loops, changed, self.deadline)
+		elif self.solver == "mg":
+			V, sweeps, work = mdpSolver.multigridValueIteration(self.model, V, frozenMask, reward, gamma, self.epsilon, loops, self.deadline)
+			backups = int(work * (~frozenMask).sum())
+		elif self.solver == "cg":
+			V, sweeps, work = mdpSolver.corridorValueIteration(self.model, V, frozenMask, reward, gamma, self.epsilon, loops, self.deadline)
+			backups = int(work * (~frozenMask).sum())
+		elif self.solver == "pi":
+			V, sweeps = mdpSolver.policyIteration(self.model, V, frozenMask, reward, gamma, loops, self.deadline)
+			backups = sweeps * int((~frozenMask).sum())
+		elif self.solver == "par":
+			V, sweeps, residual = self.parallel.valueIteration(V, frozenMask, reward, gamma, self.epsilon, loops, self.deadline)
+			backups = sweeps * int((~frozenMask).sum())
 		else:
-			n_util += (0.1 * self.valueMap[stay])
+			V, sweeps, residual = mdpSolver.valueIteration(self.model, V, frozenMask, reward, gamma, self.epsilon, loops, self.deadline)
+			backups = sweeps * int((~frozenMask).sum())
 
-		self.util_dict["n_util"] = n_util
+		self.residual = mdpSolver.bellmanResidual(self.model, V, frozenMask, reward, gamma)
+		self.lastV = V
+		self.lastFrozen = frozenMask
+		self.model.toValueMap(V, V1)
+		return sweeps, backups
 
 
-		# Repeat for the rest of the directions
-		if self.valueMap[south] != "#":
-			s_util = (0.8 * self.valueMap[south])
-		else:
-			s_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[east] != "#":
-			s_util += (0.1 * self.valueMap[east])
-		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			s_util += (0.1 * self.valueMap[west])
+	def trackGhosts(self, state):
+		# For the ghost solver: the ghost state (see mdpGhosts.py) of the nearest
+		# ghost, or None if there is none, how many more moves it is scared for,
+		# and a list of the squares of the other ghosts that are not scared.
+		# Headings come from where each ghost was on the last move
+		pacman = api.whereAmI(state)
+		ghosts = api.ghostStatesWithTimes(state)
+		lastGhosts = self.lastGhosts
+		self.lastGhosts = [position for (position, ghostTime) in ghosts]
+
+		if not ghosts:
+			return None, 0, []
+		nearest = min(range(len(ghosts)), key=lambda i: util.manhattanDistance(pacman, ghosts[i][0]))
+		last = None
+		if lastGhosts is not None:
+			last = lastGhosts[nearest]
+		ghost = self.ghostModel.stateOf(ghosts[nearest][0], last)
+		others = [ghosts[i][0] for i in range(len(ghosts)) if i != nearest and ghosts[i][1] == 0]
+		return ghost, ghosts[nearest][1], others
+
+	def ghostValueIteration(self, state, reward, gamma, V1, ghost, timer, others):
+		# The ghost solver's solve. Food and capsules are terminal with the values
+		# they have in rewardMap, as are being caught by the modelled ghost and
+		# the squares of the other ghosts, with the -10 makeValueMap gives ghosts.
+		# A capsule is worth the utility of the chase it starts instead, if that
+		# is more, as worked out on the last move the ghost was not scared.
+		# With the ghost scared for timer more moves, the move comes from the
+		# utilities for that much scared time (mdpGhosts.scaredInduction), which
+		# start from the utilities once it is dangerous again.
+		# V1 gets the utilities of pacman's squares with the ghost where it is now,
+		# for the display and self.policy, but the move is picked from the
+		# joint utilities. Returns the number of sweeps and backups and the move
+		ghostModel = self.ghostModel
+		death = -10
+		# Eating a scared ghost is worth two pieces of food
+		eaten = 10
+
+		R = self.model.fromValueMap(self.rewardMap)
+		capsules = self.model.cellMask(api.capsules(state))
+		blocked = self.model.cellMask(others)[:, None] | ghostModel.caught
+		frozen = blocked | (R > 0)[:, None]
+		fixed = np.where(blocked, death, R[:, None])
+		if self.capsuleValues is not None:
+			fixed = np.where(capsules[:, None] & ~blocked, np.maximum(fixed, self.capsuleValues), fixed)
+
+		if self.warm and self.lastJointV is not None:
+			V = self.lastJointV
 		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["s_util"] = s_util
+			V = fixed
+		loops = self.getMaxIterations(200)
+		V, sweeps, residual = mdpGhosts.jointValueIteration(ghostModel, V, frozen, fixed, reward, gamma, death,
+															self.epsilon, loops, self.deadline)
+
+		Q = ghostModel.expectedUtilities(V, death)
+		self.residual = float(np.abs(np.where(frozen, fixed, reward + gamma * Q.max(axis=1)) - V).max())
+		self.lastJointV = V
+		backups = sweeps * int((~frozen).sum())
+
+		# While the ghost is scared, capsules eaten are gone for good rather than
+		# terminal
+		if timer > 0 or capsules.any():
+			scaredFrozen = blocked | ((R > 0) & ~capsules)[:, None]
+			stages = timer
+			if timer == 0:
+				stages = mdpGhosts.SCARED_TIME
+			scaredV, scaredQ, stages = mdpGhosts.scaredInduction(ghostModel, V, scaredFrozen, fixed, reward, gamma, eaten,
+																stages, self.epsilon, self.deadline)
+			sweeps += stages
+			backups += stages * int((~scaredFrozen).sum())
+			if timer == 0:
+				self.capsuleValues = scaredV
+			elif scaredQ is not None:
+				V, Q = scaredV, scaredQ
+		self.model.toValueMap(V[:, ghost], V1)
 
+		pacman = api.whereAmI(state)
+		action = mdpSolver.ACTIONS[Q[self.model.index[pacman], :, ghost].argmax()]
+		return sweeps, backups, KEYS[ACTIONS.index(action)]
 
-		if self.valueMap[east] != "#":
-			e_util = (0.8 * self.valueMap[east])
-		else:
-			e_util = (0.8 * self.valueMap[stay])
+	def getPolicy(self, state, iteratedMap):
+		# gets movement policy for pacman's location at a given state
+		# using valueiteration map that is updated at every step
 
-		if self.valueMap[north] != "#":
-			e_util += (0.1 * self.valueMap[north])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
+		pacman = api.whereAmI(state)
 
-		if self.valueMap[south] != "#":
-			e_util += (0.1 * self.valueMap[south])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
+		# put in a valueMap that has been run across valueIteration (otherwise)
+		# a proper policy would not be able to be retrieved
+		# The policy for a valueMap is only made once (see mdpPolicy.py)
+		if self.policy is None or self.policy.valueMap is not iteratedMap:
+			self.policy = Policy(iteratedMap)
 
-		self.util_dict["e_util"] = e_util
+		# return the move with the highest MEU
+		return self.policy.keyAt(pacman[0], pacman[1])
 
-		if self.valueMap[west] != "#":
-			w_util = (0.8 * self.valueMap[west])
-		else:
-			w_util = (0.8 * self.valueMap[stay])
+	def getAction(self, state):
 
-		if self.valueMap[north] != "#":
-			w_util += (0.1 * self.valueMap[north])
-		else:
-			w_util += (0.1 * self.valueMap[stay])
+		if self.solver == "table":
+			return self.getTableAction(state)
 
-		if self.valueMap[south] != "#":
-			w_util += (0.1 * self.valueMap[south])
+		# The time budget counts from here, so building the value map comes out of it
+		moveStart = time.time()
+		budget = self.getBudget()
+		if budget is None:
+			self.deadline = None
 		else:
-			w_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["w_util"] = w_util
-
-		# get max expected utility
-		maxMEU = max(self.util_dict.values())
-		# return the move with the highest MEU
-		return self.util_dict.keys()[self.util_dict.values().index(maxMEU)]
-
-	def getAction(self, state):
+			self.deadline = moveStart + budget
 
 		print "-" * 30
 		legal = api.legalActions(state)
@@ -556,6 +847,10 @@ class MDPAgent(Agent):
 		maxWidth = self.getLayoutWidth(corners) - 1
 		maxHeight = self.getLayoutHeight(corners) - 1
 
+		# Bring the ghost tracking up to date with what pacman can see now
+		if self.tracker is not None:
+			self.tracker.update(state)
+
 		# This function updates all locations at every state
 		# for every action retrieved by getAction, thi3s map is recalibrated
 		valueMap = self.makeValueMap(state)
@@ -563,13 +858,35 @@ class MDPAgent(Agent):
 		# If the map is large enough, calculate buffers around ghosts
 		# also use higher number of iteration loops to get a more reasonable policy
 
-		if maxWidth >= 10 and maxHeight >= 10:
-			self.valueIteration(state, 0, 0.6, valueMap)
+		ghost = None
+		if self.solver == "ghost":
+			ghost, timer, others = self.trackGhosts(state)
+
+		start = time.time()
+		if ghost is not None:
+			if maxWidth >= 10 and maxHeight >= 10:
+				self.sweeps, self.backups, ghostMove = self.ghostValueIteration(state, 0, 0.6, valueMap, ghost, timer, others)
+			else:
+				self.sweeps, self.backups, ghostMove = self.ghostValueIteration(state, 0.2, 0.7, valueMap, ghost, timer, others)
+		elif maxWidth >= 10 and maxHeight >= 10:
+			self.sweeps, self.backups = self.valueIteration(state, 0, 0.6, valueMap)
 		else:
-			self.valueIterationSmall(state, 0.2, 0.7, valueMap)
+			self.sweeps, self.backups = self.valueIterationSmall(state, 0.2, 0.7, valueMap)
+		self.solveTime = time.time() - start
+
+		print "sweeps: ", self.sweeps, "backups: ", self.backups, "residual: %.6f" % self.residual, "time: %.4fs" % self.solveTime
+		self.lastValueMap = valueMap.copy()
+
+		# Work out the best move once. self.policy keeps the policy for the whole
+		# board, for anything that wants more than pacman's move
+		self.policy = Policy(valueMap)
+		if ghost is None:
+			move = self.getPolicy(state, valueMap)
+		else:
+			move = ghostMove
 
 		print "best move: "
-		print self.getPolicy(state, valueMap)
+		print move
 
 		# Update values in map with iterations
 		for i in range(self.map.getWidth()):
@@ -579,18 +896,5 @@ class MDPAgent(Agent):
 
 		self.map.prettyDisplay()
 
-
-		# If the key of the move with MEU = n_util, return North as the best decision
-		# And so on...
-
-		if self.getPolicy(state, valueMap) == "n_util":
-			return api.makeMove('North', legal)
-
-		if self.getPolicy(state, valueMap) == "s_util":
-			return api.makeMove('South', legal)
-
-		if self.getPolicy(state, valueMap) == "e_util":
-			return api.makeMove('East', legal)
-
-		if self.getPolicy(state, valueMap) == "w_util":
-			return api.makeMove('West', legal)
+		# Make the move with the highest MEU (n_util is North and so on)
+		return api.makeMove(DIRECTIONS[move], legal)
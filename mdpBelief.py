@@ -0,0 +1,190 @@
+# mdpBelief.py
+#
+# Where the ghosts probably are, for MDPAgent under api.partialVisibility.
+#
+# With partial visibility api.ghosts only returns the ghosts Pacman can
+# see (along the corridor he is facing, or a square into side corridors)
+# or hear (within api.hearingLimit), so a ghost that turns a corner
+# vanishes from the map the agent plans on. A BeliefTracker keeps, for
+# every ghost, a probability for each of its states in a GhostModel (its
+# square and heading, see mdpGhosts.py) and updates them each move as a
+# Bayes filter:
+#
+# - predict: the ghost moves as the GhostModel says, one move per move
+#   of Pacman's, at half speed and away from Pacman while it is scared.
+#   A scared ghost that meets Pacman is eaten and goes back to where it
+#   started
+# - observe: a ghost that is seen or heard is where it was seen; a ghost
+#   that is not is nowhere Pacman could have seen or heard it
+#
+# What Pacman could have seen or heard is worked out by api.py itself
+# (visibleSquares, audible), so the tracker rules ghosts out on exactly
+# the squares where api.ghosts would have reported them.
+#
+# The ghosts' scared timers cannot be observed, so they are kept from
+# what Pacman does: eating a capsule he has seen scares every ghost for
+# SCARED_TIME moves, and a ghost that was probably eaten stops being
+# scared. A scared ghost moves half a square at a time, and between two
+# squares api.ghosts only reports it when it is heard, so a scared ghost
+# that is not reported is only ruled out where it would have been heard
+# wherever it was within its square.
+#
+# api.ghosts does not say which ghost is which, so each sighting goes to
+# the ghost that was most likely to be on that square. That can swap two
+# ghosts, in which case each is sent back to the other's start when
+# eaten.
+#
+# This is the exact filter on the grid rather than a particle filter: a
+# layout has a few hundred ghost states, fewer than the particles it
+# would take to cover them, and a move costs a handful of array
+# operations per ghost whatever the ghosts do.
+#
+# Needs numpy, and is only imported by mdpAgents.py when it is there.
+
+import numpy as np
+import api
+from pacman import SCARED_TIME
+
+class BeliefTracker:
+
+	# beliefs: (ghosts, m) array, the probability of each ghost being in
+	#          each state of ghostModel
+	# timers:  how many more moves each ghost is scared for
+	# capsules: the capsules Pacman has seen and not yet eaten
+	#
+	# The ghosts start out on the squares in starts, and go back there
+	# when they are eaten.
+	def __init__(self, ghostModel, starts):
+		self.ghostModel = ghostModel
+		self.model = ghostModel.model
+		self.beliefs = np.zeros((len(starts), ghostModel.size()))
+		for k, position in enumerate(starts):
+			self.beliefs[k] = self.pointBelief(position)
+		self.spawns = [ghostModel.stateOf(position, None) for position in starts]
+		self.timers = [0] * len(starts)
+		self.capsules = set()
+		self.lastPacman = None
+
+	def pointBelief(self, position):
+		# A ghost known to be at position, heading any way it could be
+		ghostModel = self.ghostModel
+		i = self.model.indexOf(int(position[0]), int(position[1]), -1)
+		belief = (ghostModel.cells == i).astype(float)
+		return belief / belief.sum()
+
+	def update(self, state):
+		# One move: Pacman moves, the ghosts move, then Pacman sees or hears
+		# the ghosts and capsules that api.py reports in state
+		# The ghosts have not moved before Pacman's first move
+		pacman = api.whereAmI(state)
+		if self.lastPacman is not None:
+			if pacman in self.capsules:
+				self.capsules.discard(pacman)
+				self.timers = [SCARED_TIME] * len(self.timers)
+			self.predict(self.model.indexOf(int(pacman[0]), int(pacman[1]), 0))
+		self.lastPacman = pacman
+		self.capsules.update(api.capsules(state))
+
+		self.observe(state, api.ghosts(state))
+
+	def predict(self, pacmanCell):
+		# As the game does it: a scared ghost on the square Pacman moves to is
+		# eaten, then each ghost moves and counts its timer down, and is eaten
+		# if it is still scared and lands on Pacman
+		ghostModel = self.ghostModel
+		caught = ghostModel.cells == pacmanCell
+		for k in range(len(self.beliefs)):
+			scared = self.timers[k] > 0
+			if scared:
+				self.eat(k, caught)
+			successors, probabilities = self.transitions(pacmanCell, scared)
+			moved = (self.beliefs[k][:, None] * probabilities).ravel()
+			self.beliefs[k] = np.bincount(successors.ravel(), weights=moved, minlength=ghostModel.size())
+			self.timers[k] = max(0, self.timers[k] - 1)
+			if self.timers[k] > 0:
+				self.eat(k, caught)
+
+	def transitions(self, pacmanCell, scared):
+		# The successor and probability tables for a ghost's next move. A
+		# random ghost's moves are the same wherever Pacman is
+		ghostModel = self.ghostModel
+		if scared:
+			successors, probabilities = ghostModel.scaredSuccessors, ghostModel.scaredProbabilities
+		else:
+			successors, probabilities = ghostModel.successors, ghostModel.probabilities
+		if len(probabilities) == 1:
+			return successors, probabilities[0]
+		return successors, probabilities[pacmanCell]
+
+	def eat(self, k, caught):
+		# Ghost k, scared, is eaten if it is in one of the caught states, and
+		# goes back to its start. If it most likely was, it is no longer scared
+		eaten = self.beliefs[k][caught].sum()
+		if eaten > 0:
+			self.beliefs[k][caught] = 0
+			self.beliefs[k][self.spawns[k]] += eaten
+			if eaten >= 0.5:
+				self.timers[k] = 0
+
+	def observe(self, state, observed):
+		# Pacman sees or hears the ghosts at the positions in observed and no
+		# others
+		ghostModel = self.ghostModel
+		unseen = list(range(len(self.beliefs)))
+		for position in observed:
+			if not unseen:
+				break
+			i = self.model.indexOf(int(position[0]), int(position[1]), -1)
+			if i < 0:
+				continue
+			here = ghostModel.cells == i
+			k = max(unseen, key=lambda k: self.beliefs[k][here].sum())
+			unseen.remove(k)
+			belief = np.where(here, self.beliefs[k], 0)
+			if belief.sum() > 0:
+				self.beliefs[k] = belief / belief.sum()
+			else:
+				self.beliefs[k] = self.pointBelief(position)
+
+		# The rest are somewhere out of sight, or anywhere out of sight if the
+		# belief had them all in view. A scared ghost can be half a square
+		# from its square, so only squares within earshot from all of it count
+		region = self.observableSquares(state)
+		nearby = self.squareMask(api.distanceLimited(self.model.cells, state, api.hearingLimit - 1))
+		for k in unseen:
+			if self.timers[k] > 0:
+				outOfSight = ~nearby[ghostModel.cells]
+			else:
+				outOfSight = ~region[ghostModel.cells]
+			belief = np.where(outOfSight, self.beliefs[k], 0)
+			if belief.sum() == 0:
+				belief = outOfSight.astype(float)
+			if belief.sum() > 0:
+				self.beliefs[k] = belief / belief.sum()
+
+	def observableSquares(self, state):
+		# Boolean array over the squares, True where api.ghosts would report a
+		# ghost: the squares api.visibleSquares says Pacman can see, and the
+		# ones within earshot (api.audible)
+		squares = set(api.audible(self.model.cells, state))
+		for seen in api.visibleSquares(state):
+			squares.update(seen)
+		return self.squareMask(squares)
+
+	def squareMask(self, squares):
+		# Boolean array over the squares, True on the (x, y) in squares
+		mask = np.zeros(self.model.size(), dtype=bool)
+		for (x, y) in squares:
+			mask[self.model.index[x, y]] = True
+		return mask
+
+	def occupancy(self):
+		# Expected number of ghosts on each square, as an array over the squares
+		ghostModel = self.ghostModel
+		return np.bincount(ghostModel.cells, weights=self.beliefs.sum(axis=0), minlength=self.model.size())
+
+	def likelySquares(self, threshold):
+		# The (x, y) squares with at least threshold ghosts expected on them,
+		# and how many
+		occupancy = self.occupancy()
+		return [(self.model.cells[i], occupancy[i]) for i in np.flatnonzero(occupancy >= threshold)]
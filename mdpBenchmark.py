@@ -0,0 +1,189 @@
+# mdpBenchmark.py
+#
+# Compares the array solvers in mdpSolver.py on the bundled layouts.
+#
+# Each layout is set up as MDPAgent sees it at the start of a game: all
+# food and capsules are terminal squares worth 5, ghosts are terminal
+# squares worth -10, and every other square is solved for. For each
+# solver this prints the number of sweeps over the full layout, the
+# total work in full-layout sweeps (for solvers that also work on
+# smaller problems) and the wall time of one solve.
+#
+# It also reports how far collapsing corridors (mdpSolver.CorridorGraph)
+# shrinks each layout: the number of junctions and dead ends left, and
+# how many squares the corridor solver still has to back up once the
+# starting food is taken into account.
+#
+# Layouts named maze<width>x<height>, e.g. maze301x301, are generated
+# (see makeMaze) rather than loaded, for trying the solvers on layouts
+# much bigger than the bundled ones. The par solver is run once for each
+# worker count given with -w, and its utilities are checked against vi.
+#
+# To run:
+#
+# python mdpBenchmark.py -l originalClassic,bigSearch,bigMaze -g 0.9
+# python mdpBenchmark.py -l maze301x301 -s vi,par -w 1,2,4
+
+import random
+import re
+import time
+from optparse import OptionParser
+
+import numpy as np
+import api
+import layout
+import mdpSolver
+import mdpParallel
+import pacman
+
+SOLVERS = ["vi", "mg", "cg"]
+
+# Largest difference from vi allowed in the par utilities
+TOLERANCE = 1e-9
+
+def makeMaze(width, height, seed=0):
+	# A random maze of the given size (odd sizes work best), made by a
+	# depth first search over the odd squares. A tenth of the remaining
+	# inner walls are knocked out so there are loops as well as dead ends.
+	# About one square in ten has food, and there is a ghost in each
+	# corner.
+	rng = random.Random(seed)
+	grid = [['%'] * width for y in range(height)]
+	stack = [(1, 1)]
+	grid[1][1] = ' '
+	while stack:
+		x, y = stack[-1]
+		neighbours = [(x + dx, y + dy) for dx, dy in ((2, 0), (-2, 0), (0, 2), (0, -2))
+					if 0 < x + dx < width - 1 and 0 < y + dy < height - 1 and grid[y + dy][x + dx] == '%']
+		if not neighbours:
+			stack.pop()
+			continue
+		nx, ny = rng.choice(neighbours)
+		grid[(y + ny) / 2][(x + nx) / 2] = ' '
+		grid[ny][nx] = ' '
+		stack.append((nx, ny))
+
+	for y in range(1, height - 1):
+		for x in range(1, width - 1):
+			if grid[y][x] == '%' and rng.random() < 0.1:
+				if (grid[y][x - 1] == ' ' and grid[y][x + 1] == ' ') or (grid[y - 1][x] == ' ' and grid[y + 1][x] == ' '):
+					grid[y][x] = ' '
+			elif grid[y][x] == ' ' and rng.random() < 0.1:
+				grid[y][x] = '.'
+
+	for x, y in ((1, 1), (1, height - 2), (width - 2, 1), (width - 2, height - 2)):
+		grid[y][x] = 'G'
+	grid[1][(width / 2) | 1] = 'P'
+	return layout.Layout([''.join(row) for row in grid])
+
+def makeProblem(layoutName):
+	# Returns the LayoutModel for a layout, with the utilities and frozen
+	# mask of its starting position.
+	maze = re.match(r'maze(\d+)x(\d+)$', layoutName)
+	if maze:
+		board = makeMaze(int(maze.group(1)), int(maze.group(2)))
+	else:
+		board = layout.getLayout(layoutName)
+	if board is None:
+		raise Exception("The layout " + layoutName + " cannot be found")
+	state = pacman.GameState()
+	state.initialize(board, board.getNumGhosts())
+
+	model = mdpSolver.LayoutModel(api.walls(state), board.width, board.height)
+	V = np.zeros(model.size())
+	food = model.cellMask(api.food(state) + api.capsules(state))
+	ghosts = model.cellMask(api.ghosts(state))
+	V[food] = 5
+	V[ghosts] = -10
+	return model, V, food | ghosts
+
+def runSolver(solver, model, V, frozen, gamma, epsilon, maxIterations, workers=None):
+	# Returns the sweeps over the full layout, the total work, in
+	# full-layout sweeps, and the utilities.
+	if solver == "vi":
+		V, sweeps, residual = mdpSolver.valueIteration(model, V, frozen, 0, gamma, epsilon, maxIterations)
+		return sweeps, sweeps, V
+	if solver == "mg":
+		V, sweeps, work = mdpSolver.multigridValueIteration(model, V, frozen, 0, gamma, epsilon, maxIterations)
+		return sweeps, work, V
+	if solver == "cg":
+		V, sweeps, work = mdpSolver.corridorValueIteration(model, V, frozen, 0, gamma, epsilon, maxIterations)
+		return sweeps, work, V
+	if solver == "par":
+		parallel = mdpParallel.getParallelSolver(model, workers)
+		V, sweeps, residual = parallel.valueIteration(V, frozen, 0, gamma, epsilon, maxIterations)
+		return sweeps, sweeps, V
+	raise ValueError("Unknown solver: " + str(solver))
+
+def timeSolver(solver, model, V, frozen, gamma, epsilon, maxIterations, repeats, workers=None):
+	# Best wall time over a few runs, so that one slow run does not count.
+	# The par workers are started before the clock does
+	if solver == "par":
+		mdpParallel.getParallelSolver(model, workers)
+	best = None
+	for i in range(repeats):
+		start = time.time()
+		result = runSolver(solver, model, V, frozen, gamma, epsilon, maxIterations, workers)
+		taken = time.time() - start
+		if best is None or taken < best:
+			best = taken
+	return result, best
+
+def readCommand(argv):
+	parser = OptionParser(usage="python mdpBenchmark.py [options]")
+	parser.add_option('-l', '--layouts', dest='layouts',
+					help='comma separated list of layouts [Default: %default]',
+					default='mediumClassic,originalClassic,bigSearch,bigMaze,bigCorners')
+	parser.add_option('-s', '--solvers', dest='solvers',
+					help='comma separated list of solvers [Default: %default]',
+					default=','.join(SOLVERS))
+	parser.add_option('-g', '--gamma', dest='gamma', type='float',
+					help='discount factor [Default: %default]', default=0.9)
+	parser.add_option('-e', '--epsilon', dest='epsilon', type='float',
+					help='convergence tolerance [Default: %default]', default=0.001)
+	parser.add_option('-m', '--maxIterations', dest='maxIterations', type='int',
+					help='cap on sweeps [Default: %default]', default=10000)
+	parser.add_option('-w', '--workers', dest='workers',
+					help='comma separated list of worker counts for par [Default: %default]',
+					default='1,2,4')
+	parser.add_option('-r', '--repeats', dest='repeats', type='int',
+					help='runs to take the best time from [Default: %default]', default=3)
+	options, otherjunk = parser.parse_args(argv)
+	if len(otherjunk) != 0:
+		raise Exception('Command line input not understood: ' + str(otherjunk))
+	return options
+
+def runBenchmark(options):
+	print "gamma = %g, epsilon = %g" % (options.gamma, options.epsilon)
+	print "%-18s %6s %-6s %8s %8s %10s" % ("layout", "cells", "solver", "sweeps", "work", "time (s)")
+	for layoutName in options.layouts.split(','):
+		model, V, frozen = makeProblem(layoutName)
+		serial = None
+		for solver in options.solvers.split(','):
+			if solver == "par":
+				runs = [("par" + workers, int(workers)) for workers in options.workers.split(',')]
+			else:
+				runs = [(solver, None)]
+			for name, workers in runs:
+				(sweeps, work, result), taken = timeSolver(solver, model, V, frozen, options.gamma,
+												options.epsilon, options.maxIterations, options.repeats, workers)
+				print "%-18s %6d %-6s %8d %8.1f %10.4f" % (layoutName, model.size(), name, sweeps, work, taken)
+				if solver == "vi":
+					serial = result
+				elif solver == "par" and serial is not None and np.abs(result - serial).max() > TOLERANCE:
+					raise Exception(name + " does not match vi on " + layoutName)
+
+	if "cg" not in options.solvers.split(','):
+		return
+	print
+	print "%-18s %6s %6s %6s %8s %8s" % ("layout", "cells", "nodes", "chains", "nodes %", "swept %")
+	for layoutName in options.layouts.split(','):
+		model, V, frozen = makeProblem(layoutName)
+		graph = model.getCorridorGraph()
+		swept = (graph.isNode & ~frozen).sum()
+		print "%-18s %6d %6d %6d %8.1f %8.1f" % (layoutName, model.size(), graph.numberOfNodes(), len(graph.chains),
+											100.0 * graph.numberOfNodes() / model.size(), 100.0 * swept / model.size())
+
+if __name__ == '__main__':
+	import sys
+	runBenchmark(readCommand(sys.argv[1:]))
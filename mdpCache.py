@@ -0,0 +1,161 @@
+# mdpCache.py
+#
+# On-disk cache of converged utilities for MDPAgent.
+#
+# In a long batch of games on one layout (-n 500) the agent keeps meeting
+# the same rewards: the same food left and the ghosts in the same places,
+# or no ghosts at all on layouts like mediumMDPNoGhosts. A SolutionCache
+# remembers the converged ValueMap utilities for each such configuration
+# in a directory, one file per entry, so a solve can start from the
+# answer in later moves, games and runs of pacman.py.
+#
+# Entries are looked up by a key made from
+#
+# - a fingerprint of the layout (its size and walls),
+# - a bitset of the squares that still have food or capsules,
+# - a bitset of the squares the solver holds fixed,
+# - the ghost positions, to the half square,
+# - the solver settings,
+#
+# so only solves of exactly the same problem share an entry.
+#
+# The cache holds at most maxEntries entries. When it is full the least
+# recently used one is removed. Use is tracked by file modification
+# time, so it carries over between runs. Several processes can share a
+# directory: entries are written to a temporary file first and renamed
+# into place, and the directory is listed again before evicting so
+# entries written by the others count towards maxEntries too.
+
+import hashlib
+import os
+import tempfile
+from array import array
+
+class SolutionCache:
+
+	# Counters since the cache was opened:
+	#
+	# hits:      lookups that found an entry
+	# misses:    lookups that did not
+	# stores:    entries written
+	# evictions: entries removed to make room
+	def __init__(self, directory, maxEntries=1000):
+		self.directory = directory
+		self.maxEntries = max(1, int(maxEntries))
+		self.hits = 0
+		self.misses = 0
+		self.stores = 0
+		self.evictions = 0
+
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		# Last use of every entry, by key
+		self.lastUsed = {}
+		self.scan(self.entryNames())
+
+	def entryNames(self):
+		return [name for name in os.listdir(self.directory) if name.endswith(SUFFIX)]
+
+	def scan(self, names):
+		# Reads the last use of the entries called names from the files
+		lastUsed = {}
+		for name in names:
+			try:
+				lastUsed[name[:-len(SUFFIX)]] = os.path.getmtime(os.path.join(self.directory, name))
+			except OSError:
+				# Removed by another process since it was listed
+				pass
+		self.lastUsed = lastUsed
+
+	def pathOf(self, key):
+		return os.path.join(self.directory, key + SUFFIX)
+
+	def get(self, key):
+		# The utilities stored under key as an array('d'), or None
+		try:
+			f = open(self.pathOf(key), "rb")
+		except IOError:
+			self.misses += 1
+			self.lastUsed.pop(key, None)
+			return None
+		try:
+			values = array('d')
+			values.fromstring(f.read())
+		finally:
+			f.close()
+
+		self.hits += 1
+		try:
+			os.utime(self.pathOf(key), None)
+			self.lastUsed[key] = os.path.getmtime(self.pathOf(key))
+		except OSError:
+			# Evicted by another process since it was read
+			self.lastUsed.pop(key, None)
+		return values
+
+	def put(self, key, values):
+		# Stores an array('d') of utilities under key
+		handle, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+		f = os.fdopen(handle, "wb")
+		try:
+			f.write(values.tostring())
+		finally:
+			f.close()
+		os.rename(temporary, self.pathOf(key))
+		self.stores += 1
+		try:
+			self.lastUsed[key] = os.path.getmtime(self.pathOf(key))
+		except OSError:
+			# Evicted by another process already
+			self.lastUsed.pop(key, None)
+
+		# Other processes sharing the directory may have added entries this
+		# one does not know about, so it is listed again. The files are only
+		# read for their times when there are too many
+		names = self.entryNames()
+		if len(names) > self.maxEntries:
+			self.scan(names)
+		while len(self.lastUsed) > self.maxEntries:
+			oldest = min(self.lastUsed, key=self.lastUsed.get)
+			del self.lastUsed[oldest]
+			try:
+				os.remove(self.pathOf(oldest))
+			except OSError:
+				# Another process got there first
+				pass
+			self.evictions += 1
+
+	def hitRate(self):
+		lookups = self.hits + self.misses
+		if lookups == 0:
+			return 0.0
+		return float(self.hits) / lookups
+
+	def summary(self):
+		return "hits: %d misses: %d (hit rate %.2f) stores: %d evictions: %d" % (
+			self.hits, self.misses, self.hitRate(), self.stores, self.evictions)
+
+SUFFIX = ".utilities"
+
+def layoutFingerprint(width, height, wallList):
+	return hashlib.sha1(repr((width, height, sorted(wallList)))).hexdigest()
+
+def bitset(flags):
+	# Packs a list of booleans into a string, eight to a byte
+	packed = bytearray((len(flags) + 7) // 8)
+	for i, flag in enumerate(flags):
+		if flag:
+			packed[i // 8] |= 1 << (i % 8)
+	return str(packed)
+
+def makeKey(fingerprint, food, frozen, ghosts, settings):
+	# food and frozen are lists of booleans, one per square of a ValueMap;
+	# ghosts a list of (x, y) positions and settings anything with a
+	# stable repr
+	ghostSquares = sorted((int(round(2 * x)), int(round(2 * y))) for (x, y) in ghosts)
+	digest = hashlib.sha1(fingerprint)
+	digest.update(bitset(food))
+	digest.update(bitset(frozen))
+	digest.update(repr(ghostSquares))
+	digest.update(repr(settings))
+	return digest.hexdigest()
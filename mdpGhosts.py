@@ -0,0 +1,229 @@
+# mdpGhosts.py
+#
+# A ghost-aware MDP for MDPAgent's ghost solver.
+#
+# The other solvers treat a ghost as a square worth -10 that stays put,
+# with a hand-made buffer of squares around it that are solved rather
+# than held fixed (foodToCalculate in valueIteration). Here the nearest
+# ghost is part of the state instead: utilities are kept for every pair
+# of Pacman's square and the ghost's state, and the ghost moves the way
+# the ghosts in ghostAgents.py do:
+#
+# - it never stops and only turns back at a dead end (the game's legal
+#   moves for a ghost), so its state is its square plus the direction
+#   of its last move, or "stopped" at the start of a game when it may go
+#   any way
+# - it picks a move uniformly at random (RandomGhost), or with
+#   probability attack one of the moves that bring it closest to Pacman
+#   and uniformly otherwise (DirectionalGhost, whose prob_attack is 0.8)
+#
+# The ghost moves after Pacman, towards the square Pacman has just moved
+# to. Pacman dies if he moves onto the ghost or the ghost onto him.
+#
+# While the ghost is scared (after Pacman eats a capsule) it moves at
+# half speed, which is modelled as staying put half the time, and with
+# probability attack flees Pacman instead of chasing him. Meeting it then
+# eats it. The time it has left scared is part of the state too, but it
+# only ever counts down, so the utilities for t moves of scared time
+# follow from those for t - 1 in a single backup (scaredInduction): a
+# sweep per move of the timer rather than value iteration over every
+# (square, ghost, timer) state. Once a stage no longer changes, more
+# time changes nothing either and the induction stops.
+#
+# A ghost has at most four moves, so its transitions are kept as
+# successor and probability tables with four columns (padded with zero
+# probabilities), like LayoutModel's, rather than as (states x states)
+# matrices. For RandomGhost the probabilities do not depend on Pacman
+# and are stored once; for DirectionalGhost there is one table per
+# Pacman square. memoryReport says what the tables and utilities take.
+#
+# Needs numpy, and is only imported by mdpAgents.py when it is there.
+
+import numpy as np
+import mdpSolver
+from pacman import SCARED_TIME
+
+# Where a ghost goes for each entry of mdpSolver.ACTIONS. The reverse of
+# action a is a ^ 1
+VECTORS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+
+# Heading of a ghost that has not moved yet
+STOPPED = -1
+
+class GhostModel:
+
+	# The ghost's half of the joint MDP for one layout (a LayoutModel).
+	#
+	# cells:         (m,) array, the square of each ghost state
+	# headings:      (m,) array, the index into ACTIONS of the ghost's last
+	#                move, or STOPPED
+	# successors:    (m, 4) array, the ghost states each ghost state can
+	#                move to (padding repeats the state itself)
+	# probabilities: (1, m, 4) array for a random ghost, (n, m, 4) for one
+	#                that chases Pacman, whose first index is Pacman's
+	#                square after his move
+	#
+	# scaredSuccessors and scaredProbabilities are the same for a scared
+	# ghost, with a fifth column for staying put.
+	def __init__(self, model, attack=0.0):
+		self.model = model
+		self.attack = attack
+
+		states = {}
+		cells = []
+		headings = []
+		for i, (x, y) in enumerate(model.cells):
+			for heading in [STOPPED] + range(len(VECTORS)):
+				# A heading is only possible if the ghost can have come from
+				# the square behind it
+				if heading != STOPPED:
+					dx, dy = VECTORS[heading]
+					if model.indexOf(x - dx, y - dy, -1) < 0:
+						continue
+				states[(i, heading)] = len(cells)
+				cells.append(i)
+				headings.append(heading)
+		self.cells = np.array(cells, dtype=int)
+		self.headings = np.array(headings, dtype=int)
+		self.states = states
+
+		m = len(cells)
+		self.successors = np.zeros((m, len(VECTORS)), dtype=int)
+		legal = np.zeros((m, len(VECTORS)), dtype=bool)
+		for s in range(m):
+			x, y = model.cells[cells[s]]
+			moves = [a for a, (dx, dy) in enumerate(VECTORS) if model.indexOf(x + dx, y + dy, -1) >= 0]
+			heading = headings[s]
+			if heading != STOPPED and len(moves) > 1 and heading ^ 1 in moves:
+				moves.remove(heading ^ 1)
+			self.successors[s] = s
+			for a in moves:
+				dx, dy = VECTORS[a]
+				self.successors[s, a] = states[(model.indexOf(x + dx, y + dy, -1), a)]
+				legal[s, a] = True
+
+		self.probabilities = self.moveProbabilities(legal, False)
+		self.scaredSuccessors = np.column_stack([self.successors, np.arange(m)])
+		self.scaredProbabilities = np.concatenate([0.5 * self.moveProbabilities(legal, True),
+												0.5 * np.ones(self.probabilities.shape[:2] + (1,))], axis=2)
+
+		# Joint states where Pacman and the ghost share a square
+		self.caught = self.cells[None, :] == np.arange(model.size())[:, None]
+
+	def moveProbabilities(self, legal, scared):
+		# Probabilities of the moves in the successor table. A ghost that
+		# goes for Pacman picks one of its best moves with probability
+		# attack: the closest to Pacman by Manhattan distance, as
+		# DirectionalGhost measures it, or the furthest when it is scared
+		uniform = legal / np.maximum(legal.sum(axis=1), 1).astype(float)[:, None]
+		if self.attack == 0:
+			return uniform[None, :, :]
+
+		model = self.model
+		targets = self.cells[self.successors]
+		distance = (np.abs(model.xs[:, None, None] - model.xs[targets][None, :, :]) +
+					np.abs(model.ys[:, None, None] - model.ys[targets][None, :, :]))
+		if scared:
+			distance = -distance
+		distance = np.where(legal[None, :, :], distance, np.iinfo(int).max)
+		best = distance == distance.min(axis=2)[:, :, None]
+		chase = best / best.sum(axis=2).astype(float)[:, :, None]
+		return self.attack * chase + (1 - self.attack) * uniform[None, :, :]
+
+	def size(self):
+		return len(self.cells)
+
+	def stateOf(self, position, lastPosition):
+		# The ghost state of a ghost at position that was at lastPosition a
+		# move ago (None if not known). Unknown or impossible headings, such
+		# as after the ghost has been eaten and sent home, count as stopped
+		i = self.model.indexOf(int(position[0]), int(position[1]), -1)
+		heading = STOPPED
+		if lastPosition is not None:
+			move = (int(position[0] - lastPosition[0]), int(position[1] - lastPosition[1]))
+			if move in VECTORS:
+				heading = VECTORS.index(move)
+		return self.states.get((i, heading), self.states[(i, STOPPED)])
+
+	def expectedUtilities(self, V, meeting, scared=False):
+		# (n, 4, m) array of the expected utility of each action for each
+		# joint state (Pacman's square, ghost state). meeting is the utility
+		# of Pacman and the ghost meeting, whatever V says for those states
+		model = self.model
+		if scared:
+			successors, probabilities = self.scaredSuccessors, self.scaredProbabilities
+		else:
+			successors, probabilities = self.successors, self.probabilities
+		V = np.where(self.caught, meeting, V)
+		# The ghost moves after Pacman has landed on his new square
+		afterGhost = (probabilities * V[:, successors]).sum(axis=2)
+		# Unless Pacman landed on the ghost
+		afterGhost[self.caught] = meeting
+		return np.einsum("nak,nakm->nam", model.probabilities, afterGhost[model.successors])
+
+	def memoryReport(self):
+		# Bytes used by the ghost tables and by one set of joint utilities
+		tables = (self.cells.nbytes + self.headings.nbytes + self.successors.nbytes + self.probabilities.nbytes +
+				self.scaredSuccessors.nbytes + self.scaredProbabilities.nbytes + self.caught.nbytes)
+		utilities = self.model.size() * self.size() * np.dtype(float).itemsize
+		return "%d ghost states, %d joint states, tables %.1f KB, utilities %.1f KB" % (
+			self.size(), self.model.size() * self.size(), tables / 1024.0, utilities / 1024.0)
+
+# Ghost models are built once per layout and ghost behaviour
+_ghostModels = {}
+
+def getGhostModel(model, attack):
+	key = (id(model), attack)
+	if key not in _ghostModels:
+		_ghostModels[key] = GhostModel(model, attack)
+	return _ghostModels[key]
+
+def jointValueIteration(ghostModel, V, frozen, fixed, reward, gamma, death, epsilon, maxIterations, deadline=None):
+	# Value iteration over the joint states, as mdpSolver.valueIteration
+	# does over squares:
+	#
+	#   U(p, g) = reward + gamma * max_a E[U(p', g')]
+	#
+	# V, frozen and fixed are (n, m) arrays: the starting utilities, the
+	# joint states that keep a fixed value (Pacman caught, terminal food)
+	# and that value. death is the utility of being caught. Returns the
+	# utilities, the number of sweeps and the residual of the last sweep.
+	if not (0 < gamma <= 1):
+		raise ValueError("MDP must have a gamma between 0 and 1.")
+
+	threshold = mdpSolver.convergenceThreshold(epsilon, gamma)
+	V = np.where(frozen, fixed, V)
+
+	sweeps = 0
+	residual = float("inf")
+	while sweeps < maxIterations and residual >= threshold and not mdpSolver.outOfTime(deadline):
+		meu = ghostModel.expectedUtilities(V, death).max(axis=1)
+		newV = np.where(frozen, fixed, reward + gamma * meu)
+		residual = float(np.abs(newV - V).max())
+		V = newV
+		sweeps += 1
+	return V, sweeps, residual
+
+def scaredInduction(ghostModel, V, frozen, fixed, reward, gamma, eaten, timer, epsilon, deadline=None):
+	# Utilities with the ghost scared for timer more moves, by backward
+	# induction from V, the utilities once it stops being scared:
+	#
+	#   U_t(p, g) = reward + gamma * max_a E[U_t-1(p', g')]
+	#
+	# with the scared ghost's moves, and eaten for meeting it. frozen and
+	# fixed are as for jointValueIteration. Stops early once a stage
+	# changes by less than the convergence threshold, or at the deadline.
+	# Returns the utilities, the action utilities they were worked out
+	# from and the number of stages done.
+	threshold = mdpSolver.convergenceThreshold(epsilon, gamma)
+	Q = None
+	stages = 0
+	while stages < min(timer, SCARED_TIME) and not mdpSolver.outOfTime(deadline):
+		Q = ghostModel.expectedUtilities(V, eaten, scared=True)
+		newV = np.where(frozen, fixed, reward + gamma * Q.max(axis=1))
+		residual = float(np.abs(newV - V).max())
+		V = newV
+		stages += 1
+		if residual < threshold:
+			break
+	return V, Q, stages
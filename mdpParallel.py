@@ -0,0 +1,138 @@
+# mdpParallel.py
+#
+# Parallel value iteration for very large layouts.
+#
+# The free squares of a LayoutModel are numbered column by column, so
+# splitting the numbering into contiguous ranges cuts the layout into
+# vertical strips (tiles). Each tile is owned by a worker process. The
+# utilities live in two shared-memory arrays, one holding the last sweep
+# and one the sweep being computed. A worker reads its tile plus the
+# halo columns either side of it (its squares' successors in the
+# neighbouring tiles) from the first array and writes its tile into the
+# second. Once every worker has reported back, the two arrays swap
+# roles. That swap is the halo exchange: no data is copied between
+# processes.
+#
+# The sweeps are the same synchronous Bellman updates as
+# mdpSolver.valueIteration, so the results agree with the serial solver
+# up to rounding.
+#
+# Workers are forked, so this only works where multiprocessing uses
+# fork (Linux, macOS with Python 2).
+
+import atexit
+import ctypes
+import multiprocessing
+import numpy as np
+
+import mdpSolver
+
+def _sweepTile(connection, start, end, successors, probabilities, rawBuffers, rawFrozen, rawReward):
+	# Worker loop. Each message is (source, gamma): do one sweep of the
+	# tile from buffer source into the other buffer and reply with the
+	# tile's residual. None means stop.
+	buffers = [np.frombuffer(raw, dtype=np.float64) for raw in rawBuffers]
+	frozen = np.frombuffer(rawFrozen, dtype=np.bool_)[start:end]
+	reward = np.frombuffer(rawReward, dtype=np.float64)[start:end]
+	while True:
+		message = connection.recv()
+		if message is None:
+			break
+		source, gamma = message
+		V = buffers[source]
+		meu = (probabilities * V[successors]).sum(axis=2).max(axis=1)
+		old = V[start:end]
+		new = np.where(frozen, old, reward + gamma * meu)
+		buffers[1 - source][start:end] = new
+		connection.send(float(np.abs(new - old).max()) if end > start else 0.0)
+	connection.close()
+
+class ParallelSolver:
+
+	# A pool of worker processes doing value iteration on one
+	# LayoutModel, each on its own tile.
+	def __init__(self, model, workers):
+		self.model = model
+		n = model.size()
+		self.workers = max(1, min(int(workers), n))
+
+		self.rawBuffers = [multiprocessing.RawArray(ctypes.c_double, n) for i in range(2)]
+		self.rawFrozen = multiprocessing.RawArray(ctypes.c_bool, n)
+		self.rawReward = multiprocessing.RawArray(ctypes.c_double, n)
+		self.buffers = [np.frombuffer(raw, dtype=np.float64) for raw in self.rawBuffers]
+		self.frozen = np.frombuffer(self.rawFrozen, dtype=np.bool_)
+		self.reward = np.frombuffer(self.rawReward, dtype=np.float64)
+
+		# Tile boundaries: equal numbers of squares per worker
+		self.bounds = [int(round(k * float(n) / self.workers)) for k in range(self.workers + 1)]
+		self.connections = []
+		self.processes = []
+		for k in range(self.workers):
+			start, end = self.bounds[k], self.bounds[k + 1]
+			parentEnd, childEnd = multiprocessing.Pipe()
+			process = multiprocessing.Process(target=_sweepTile,
+				args=(childEnd, start, end, model.successors[start:end], model.probabilities[start:end],
+					self.rawBuffers, self.rawFrozen, self.rawReward))
+			process.daemon = True
+			process.start()
+			self.connections.append(parentEnd)
+			self.processes.append(process)
+
+	def valueIteration(self, V, frozen, reward, gamma, epsilon, maxIterations, deadline=None):
+		# Same arguments and results as mdpSolver.valueIteration, without
+		# the model.
+		if not (0 < gamma <= 1):
+			raise ValueError("MDP must have a gamma between 0 and 1.")
+
+		self.buffers[0][:] = V
+		self.frozen[:] = frozen
+		self.reward[:] = reward
+		threshold = mdpSolver.convergenceThreshold(epsilon, gamma)
+
+		source = 0
+		sweeps = 0
+		residual = float("inf")
+		while sweeps < maxIterations and residual >= threshold and not mdpSolver.outOfTime(deadline):
+			for connection in self.connections:
+				connection.send((source, gamma))
+			residual = max([connection.recv() for connection in self.connections])
+			source = 1 - source
+			sweeps += 1
+		return self.buffers[source].copy(), sweeps, residual
+
+	def close(self):
+		# Stops the workers and lets go of the shared arrays. Closing twice
+		# does nothing
+		for connection in self.connections:
+			try:
+				connection.send(None)
+			except (IOError, OSError):
+				# The worker has already gone
+				pass
+			connection.close()
+		for process in self.processes:
+			process.join()
+		self.connections = []
+		self.processes = []
+		self.buffers = self.frozen = self.reward = None
+		self.rawBuffers = self.rawFrozen = self.rawReward = None
+
+# The pool is kept while games stay on the same layout and worker count,
+# so that they reuse its processes. Asking for another closes it.
+_solvers = {}
+
+def getParallelSolver(model, workers=None):
+	if workers is None:
+		workers = multiprocessing.cpu_count()
+	key = (id(model), int(workers))
+	if key not in _solvers:
+		closeSolvers()
+		_solvers[key] = ParallelSolver(model, workers)
+	return _solvers[key]
+
+def closeSolvers():
+	for solver in _solvers.values():
+		solver.close()
+	_solvers.clear()
+
+atexit.register(closeSolvers)
@@ -0,0 +1,94 @@
+# mdpPolicy.py
+#
+# Greedy policy extraction for MDPAgent.
+#
+# getAction used to call getPolicy once to print the best move and then
+# again for every direction it tested, working out the four expected
+# utilities of Pacman's square each time. A Policy is made once per move
+# from the solved ValueMap (see valueMap.py). It works out the action for
+# a square the first time it is asked for it and remembers it after that.
+#
+# toArray gives the action for every square of the board in one pass, so
+# displays and analysis tools can have the whole policy without another
+# solve. That needs numpy; the single-square lookups do not.
+
+from pacman import Directions
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# The moves and the names getPolicy has always given them, in the order
+# ties are broken in: the first of the best moves in this list is taken.
+# (This is the order Python 2 lists the keys of getPolicy's old
+# {"n_util": ..., "s_util": ..., "e_util": ..., "w_util": ...} dictionary
+# in, so the agent moves exactly as it did.)
+KEYS = ["w_util", "e_util", "s_util", "n_util"]
+ACTIONS = [Directions.WEST, Directions.EAST, Directions.SOUTH, Directions.NORTH]
+DIRECTIONS = dict(zip(KEYS, ACTIONS))
+
+class Policy:
+
+	# The greedy policy for the utilities in a ValueMap. Pacman goes the
+	# intended way with probability 0.8 and slips to either side with 0.1.
+	def __init__(self, valueMap):
+		self.valueMap = valueMap
+		self.actions = {}
+
+	def expectedUtilities(self, i):
+		# Expected utilities of the moves in KEYS from the square with index i
+		values = self.valueMap.values
+		north, south, east, west = self.valueMap.neighbours[i]
+		return [0.8 * values[west] + 0.1 * values[north] + 0.1 * values[south],
+				0.8 * values[east] + 0.1 * values[north] + 0.1 * values[south],
+				0.8 * values[south] + 0.1 * values[east] + 0.1 * values[west],
+				0.8 * values[north] + 0.1 * values[east] + 0.1 * values[west]]
+
+	def bestAt(self, x, y):
+		# Index into KEYS and ACTIONS of the best move from (x, y)
+		i = self.valueMap.indexOf(int(x), int(y))
+		if i not in self.actions:
+			utilities = self.expectedUtilities(i)
+			self.actions[i] = utilities.index(max(utilities))
+		return self.actions[i]
+
+	def keyAt(self, x, y):
+		# The best move from (x, y) as getPolicy names it ("n_util" etc.)
+		return KEYS[self.bestAt(x, y)]
+
+	def actionAt(self, x, y):
+		# The best move from (x, y) as a direction
+		return ACTIONS[self.bestAt(x, y)]
+
+	def toArray(self):
+		# The best move from every square as a (width, height) array of
+		# indices into ACTIONS, -1 on walls.
+		if np is None:
+			raise ImportError("The whole-board policy needs numpy")
+		cells, neighbours = getNeighbourArrays(self.valueMap)
+		V = np.frombuffer(self.valueMap.values, dtype=np.float64)
+		N = V[neighbours]
+		north, south, east, west = N[:, 0], N[:, 1], N[:, 2], N[:, 3]
+		Q = np.column_stack([0.8 * west + 0.1 * north + 0.1 * south,
+							0.8 * east + 0.1 * north + 0.1 * south,
+							0.8 * south + 0.1 * east + 0.1 * west,
+							0.8 * north + 0.1 * east + 0.1 * west])
+
+		policy = -np.ones(self.valueMap.width * self.valueMap.height, dtype=int)
+		policy[cells] = Q.argmax(axis=1)
+		return policy.reshape(self.valueMap.width, self.valueMap.height)
+
+# The neighbour table of a layout as numpy arrays, built the first time
+# toArray is used on it. ValueMaps on the same layout share one
+# neighbour list, so that is what they are looked up by.
+_neighbourArrays = {}
+
+def getNeighbourArrays(valueMap):
+	key = id(valueMap.neighbours)
+	if key not in _neighbourArrays:
+		cells = np.array(valueMap.cells, dtype=int)
+		neighbours = np.array([valueMap.neighbours[i] for i in valueMap.cells], dtype=int)
+		# Keep the list alive so its id is not reused by another layout
+		_neighbourArrays[key] = (valueMap.neighbours, cells, neighbours)
+	return _neighbourArrays[key][1:]
@@ -0,0 +1,877 @@
+# mdpSolver.py
+#
+# Array-based solver backends for the MDPAgent in mdpAgents.py.
+#
+# The valueIteration functions in mdpAgents.py do every Bellman backup
+# in a pair of Python loops over a dictionary of (x, y) keys, working out
+# the neighbours of each square as they go. Here the layout is turned
+# into a transition table once (LayoutModel), utilities are kept in a
+# numpy array with one entry per free square, and a whole sweep is a
+# handful of array operations.
+#
+# The sweeps here are the textbook Bellman backup, which is not quite
+# what the dictionary solver does. Its getTransition writes each
+# square's MEU (without the reward and discount) into the copy of the
+# utilities the sweep reads from, so squares later in the sweep see
+# that instead of the square's utility. This moves the utilities it
+# converges to, not just how fast it gets there, and where two moves are
+# close it can pick a different one: with -f, vi, pi and cg first move
+# differently from dict at move 21 on mediumClassic and at move 42 on
+# mediumMDPNoGhosts. With the write-back taken out of the dictionary
+# solver, vi makes the same moves for the whole of both games.
+#
+# Needs numpy (scipy is optional). mdpAgents.py only imports this module
+# when numpy is available, so the dictionary solver still works without
+# it.
+
+import heapq
+import time
+import numpy as np
+from pacman import Directions
+import api
+
+# Policy iteration solves its linear systems with scipy's sparse solver
+# when scipy is installed, and with a dense numpy solve otherwise.
+try:
+	import scipy.sparse
+	import scipy.sparse.linalg
+except ImportError:
+	scipy = None
+
+# The four moves Pacman can try, in the order used for the action axis
+# of every table below. For each one: the intended direction and the two
+# directions Pacman may slip into instead.
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]
+MOVES = {Directions.NORTH: ((0, 1), (1, 0), (-1, 0)),
+		Directions.SOUTH: ((0, -1), (1, 0), (-1, 0)),
+		Directions.EAST: ((1, 0), (0, 1), (0, -1)),
+		Directions.WEST: ((-1, 0), (0, 1), (0, -1))}
+
+class LayoutModel:
+
+	# The static part of the MDP for one layout: which squares are free
+	# and where each action can take Pacman from each of them.
+	#
+	# Free squares are numbered 0..n-1 and utilities are kept in flat
+	# arrays of length n. The model maps between those indices and (x, y)
+	# coordinates:
+	#
+	# cells:  list of the (x, y) coordinates of the free squares
+	# index:  (width, height) array giving the index of each square, -1 on walls
+	# walls:  (width, height) boolean wall mask
+	#
+	# and holds the transition table:
+	#
+	# successors:    (n, 4, 3) array; for each square and action in ACTIONS,
+	#                the squares Pacman can end up in (intended direction
+	#                first, then the two sideways slips)
+	# probabilities: (n, 4, 3) array with the matching probabilities
+	#
+	# A move into a wall leaves Pacman where he is, so that successor is
+	# the square itself.
+	def __init__(self, wallList, width, height, prob=None):
+		if prob is None:
+			prob = api.directionProb
+		side = 0.5 * (1 - prob)
+
+		self.width = width
+		self.height = height
+		self.walls = np.zeros((width, height), dtype=bool)
+		for (x, y) in wallList:
+			self.walls[x, y] = True
+
+		self.cells = [(x, y) for x in range(width) for y in range(height) if not self.walls[x, y]]
+		self.index = -np.ones((width, height), dtype=int)
+		for i, (x, y) in enumerate(self.cells):
+			self.index[x, y] = i
+		self.xs = np.array([x for (x, y) in self.cells], dtype=int)
+		self.ys = np.array([y for (x, y) in self.cells], dtype=int)
+		# Index of each free square in a ValueMap of the same grid
+		self.flat = self.xs * height + self.ys
+
+		n = len(self.cells)
+		self.successors = np.zeros((n, len(ACTIONS), 3), dtype=int)
+		self.probabilities = np.zeros((n, len(ACTIONS), 3))
+		for i, (x, y) in enumerate(self.cells):
+			for a, action in enumerate(ACTIONS):
+				for k, (dx, dy) in enumerate(MOVES[action]):
+					self.successors[i, a, k] = self.indexOf(x + dx, y + dy, i)
+				self.probabilities[i, a] = (prob, side, side)
+
+		# Reverse of the successor table and coarser versions of the model,
+		# built when a solver needs them
+		self.predecessorLists = None
+		self.predecessorArrays = None
+		self.hierarchy = None
+		self.corridorGraph = None
+		self.successorLists = None
+		self.probabilityLists = None
+
+	def indexOf(self, x, y, default):
+		# Index of square (x, y), or default if it is a wall or off the grid
+		if 0 <= x < self.width and 0 <= y < self.height and not self.walls[x, y]:
+			return self.index[x, y]
+		return default
+
+	def size(self):
+		return len(self.cells)
+
+	def getPredecessors(self):
+		# For every square, the squares that some action can move Pacman
+		# into it from. A square next to a wall is its own predecessor.
+		if self.predecessorLists is None:
+			predecessors = [set() for i in range(len(self.cells))]
+			for i, successors in enumerate(self.successors.tolist()):
+				for actionSuccessors in successors:
+					for j in actionSuccessors:
+						predecessors[j].add(i)
+			self.predecessorLists = [sorted(p) for p in predecessors]
+		return self.predecessorLists
+
+	def getPredecessorArrays(self):
+		# The predecessor lists packed into two arrays: the predecessors
+		# of square i are indices[indptr[i]:indptr[i + 1]].
+		if self.predecessorArrays is None:
+			predecessors = self.getPredecessors()
+			indptr = np.zeros(len(predecessors) + 1, dtype=int)
+			indptr[1:] = np.cumsum([len(p) for p in predecessors])
+			indices = np.array([i for p in predecessors for i in p], dtype=int)
+			self.predecessorArrays = (indptr, indices)
+		return self.predecessorArrays
+
+	def predecessorsOf(self, squares):
+		# All the predecessors of the given squares (an array of indices),
+		# without repeats.
+		indptr, indices = self.getPredecessorArrays()
+		if len(squares) == 0:
+			return squares
+		return np.unique(np.concatenate([indices[indptr[i]:indptr[i + 1]] for i in squares]))
+
+	def getHierarchy(self):
+		# This model followed by successively coarser CoarseModels, down
+		# to one with at most COARSEST_SIZE nodes.
+		if self.hierarchy is None:
+			self.hierarchy = [self]
+			while self.hierarchy[-1].size() > COARSEST_SIZE:
+				coarse = CoarseModel(self.hierarchy[-1])
+				if coarse.size() == self.hierarchy[-1].size():
+					break
+				self.hierarchy.append(coarse)
+		return self.hierarchy
+
+	def getCorridorGraph(self):
+		if self.corridorGraph is None:
+			self.corridorGraph = CorridorGraph(self)
+		return self.corridorGraph
+
+	def getTransitionLists(self):
+		# The transition table as nested Python lists. Solvers that back
+		# up one square at a time are much faster on these than on
+		# numpy arrays.
+		if self.successorLists is None:
+			self.successorLists = self.successors.tolist()
+			self.probabilityLists = self.probabilities.tolist()
+		return self.successorLists, self.probabilityLists
+
+	def expectedUtilities(self, V):
+		# Expected utility of trying each action from every square, as an
+		# (n, 4) array.
+		return (self.probabilities * V[self.successors]).sum(axis=2)
+
+	# Conversion to and from the ValueMaps used by MDPAgent (see
+	# valueMap.py). A ValueMap has an entry for every square of the grid,
+	# numbered in the same column order as the free squares here, so the
+	# conversion is a gather or scatter through self.flat.
+	def fromValueMap(self, valueMap):
+		return np.frombuffer(valueMap.values, dtype=np.float64)[self.flat]
+
+	def toValueMap(self, V, valueMap):
+		np.frombuffer(valueMap.values, dtype=np.float64)[self.flat] = V
+
+	def cellMask(self, cells):
+		# Returns a boolean array over the free squares that is True for
+		# every (x, y) in cells.
+		#
+		# Ghosts can sit between two squares, e.g. (3.5, 2). The dictionary
+		# solver only ever matches whole squares against these lists, so
+		# positions that are not on a square are left out here as well.
+		mask = np.zeros(len(self.cells), dtype=bool)
+		for (x, y) in cells:
+			if x == int(x) and y == int(y):
+				i = self.indexOf(int(x), int(y), -1)
+				if i >= 0:
+					mask[i] = True
+		return mask
+
+	def toArray(self, V, wallValue=0):
+		# Spreads a flat array of utilities out into a (width, height) grid
+		U = np.empty((self.width, self.height))
+		U[:] = wallValue
+		U[self.xs, self.ys] = V
+		return U
+
+# Multigrid stops coarsening once a level has this many nodes or fewer.
+COARSEST_SIZE = 32
+
+class CoarseModel:
+
+	# A coarser version of a LayoutModel (or of another CoarseModel) for
+	# multigridValueIteration.
+	#
+	# Squares of the finer model that lie in the same 2x2 block and are
+	# connected inside it are merged into one node; squares on either
+	# side of a wall stay apart. One move on the coarse model stands for
+	# two moves of the finer one with the same action, so it covers
+	# roughly the width of a node: from a node, each action leads
+	# wherever that two-move sequence would take the node's squares on
+	# average. Solvers should discount it by gamma ** 2.
+	#
+	# cells:         (x, y) block coordinates of each node
+	# parent:        for each square of the finer model, its node here
+	# counts:        number of finer squares in each node
+	# successors and probabilities are as in LayoutModel, except that
+	# the last axis is as long as the widest distribution and padded
+	# with zero probabilities.
+	def __init__(self, fine):
+		self.fine = fine
+		fineSuccessors = fine.successors.tolist()
+		fineProbabilities = fine.probabilities.tolist()
+
+		# Group the squares of each block into the parts connected by a move
+		# that stays inside the block.
+		blocks = [(x // 2, y // 2) for (x, y) in fine.cells]
+		group = list(range(len(blocks)))
+		def find(i):
+			while group[i] != i:
+				group[i] = group[group[i]]
+				i = group[i]
+			return i
+		for i in range(len(blocks)):
+			for a in range(len(ACTIONS)):
+				for j, p in zip(fineSuccessors[i][a], fineProbabilities[i][a]):
+					if p > 0 and blocks[j] == blocks[i]:
+						group[find(j)] = find(i)
+
+		roots = sorted(set(find(i) for i in range(len(blocks))), key=lambda i: (blocks[i], i))
+		position = dict((root, node) for node, root in enumerate(roots))
+		self.cells = [blocks[root] for root in roots]
+		self.parent = np.array([position[find(i)] for i in range(len(blocks))], dtype=int)
+		self.counts = np.bincount(self.parent, minlength=len(self.cells))
+
+		distributions = [[{} for action in ACTIONS] for cell in self.cells]
+		for i, node in enumerate(self.parent.tolist()):
+			weight = 1.0 / self.counts[node]
+			for a in range(len(ACTIONS)):
+				distribution = distributions[node][a]
+				for j, p in zip(fineSuccessors[i][a], fineProbabilities[i][a]):
+					for k, q in zip(fineSuccessors[j][a], fineProbabilities[j][a]):
+						target = self.parent[k]
+						distribution[target] = distribution.get(target, 0.0) + weight * p * q
+
+		width = max(len(d) for node in distributions for d in node)
+		self.successors = np.zeros((len(self.cells), len(ACTIONS), width), dtype=int)
+		self.probabilities = np.zeros((len(self.cells), len(ACTIONS), width))
+		for node in range(len(self.cells)):
+			self.successors[node] = node
+			for a in range(len(ACTIONS)):
+				for k, (target, p) in enumerate(sorted(distributions[node][a].items())):
+					self.successors[node, a, k] = target
+					self.probabilities[node, a, k] = p
+
+	def size(self):
+		return len(self.cells)
+
+	def expectedUtilities(self, V):
+		return (self.probabilities * V[self.successors]).sum(axis=2)
+
+	def restrict(self, V, frozen):
+		# Coarse utilities and frozen mask from fine ones. A node is frozen
+		# if any of its squares is, and then takes the mean of its frozen
+		# squares' values; otherwise it takes the mean of all of them.
+		frozenCounts = np.bincount(self.parent, weights=frozen, minlength=self.size())
+		frozenTotals = np.bincount(self.parent, weights=V * frozen, minlength=self.size())
+		totals = np.bincount(self.parent, weights=V, minlength=self.size())
+		coarseFrozen = frozenCounts > 0
+		coarseV = np.where(coarseFrozen, frozenTotals / np.maximum(frozenCounts, 1), totals / self.counts)
+		return coarseV, coarseFrozen
+
+	def prolong(self, coarseV, coarseFrozen, V, frozen):
+		# Fine utilities to start from: every square that is not frozen
+		# takes the utility of its node. A frozen node's value is a reward
+		# rather than an estimate for its other squares, so those keep the
+		# values they had.
+		keep = frozen | coarseFrozen[self.parent]
+		return np.where(keep, V, coarseV[self.parent])
+
+class CorridorGraph:
+
+	# The corridors of a layout, for corridorValueIteration.
+	#
+	# A square with exactly two open neighbours is a link in a corridor.
+	# Every other square (junctions, dead ends) is a node. Each corridor
+	# is a chain of links running from one node to another:
+	#
+	# isNode:     boolean array over the squares of the LayoutModel
+	# chains:     list of arrays of link squares, in order along the corridor
+	# chainEnds:  the node at each end of each chain, as (before, after)
+	# before, after: for each link, its neighbour towards the start and
+	#             the end of its chain (-1 for nodes)
+	# toBefore, toSelf, toAfter: (n, 4) arrays; for each link and action in
+	#             ACTIONS, the probability of moving to its before neighbour,
+	#             staying put and moving to its after neighbour. A link can
+	#             go nowhere else.
+	#
+	# A ring of links with no node on it gets its first square made a node.
+	def __init__(self, model):
+		n = model.size()
+		intended = model.successors[:, :, 0].tolist()
+		neighbours = [sorted(set(intended[i]) - set([i])) for i in range(n)]
+		self.isNode = np.array([len(nb) != 2 for nb in neighbours], dtype=bool)
+
+		def walk(previous, square, seen):
+			# Follows links from square (reached from previous) until a node
+			# or an already seen square. Returns the links and where it stopped.
+			path = []
+			while not self.isNode[square] and not seen[square]:
+				seen[square] = True
+				path.append(square)
+				first, second = neighbours[square]
+				if first == previous:
+					previous, square = square, second
+				else:
+					previous, square = square, first
+			return path, square
+
+		self.chains = []
+		self.chainEnds = []
+		seen = np.zeros(n, dtype=bool)
+		for start in range(n):
+			if self.isNode[start] or seen[start]:
+				continue
+			seen[start] = True
+			first, second = neighbours[start]
+			afterPath, afterEnd = walk(start, second, seen)
+			if afterEnd == start:
+				# A ring: the start becomes the node at both ends
+				self.isNode[start] = True
+				self.chains.append(np.array(afterPath, dtype=int))
+				self.chainEnds.append((start, start))
+				continue
+			beforePath, beforeEnd = walk(start, first, seen)
+			beforePath.reverse()
+			self.chains.append(np.array(beforePath + [start] + afterPath, dtype=int))
+			self.chainEnds.append((beforeEnd, afterEnd))
+
+		self.before = -np.ones(n, dtype=int)
+		self.after = -np.ones(n, dtype=int)
+		for chain, (beforeEnd, afterEnd) in zip(self.chains, self.chainEnds):
+			squares = [beforeEnd] + chain.tolist() + [afterEnd]
+			for k in range(1, len(squares) - 1):
+				self.before[squares[k]] = squares[k - 1]
+				self.after[squares[k]] = squares[k + 1]
+
+		self.toBefore = np.zeros((n, len(ACTIONS)))
+		self.toSelf = np.zeros((n, len(ACTIONS)))
+		self.toAfter = np.zeros((n, len(ACTIONS)))
+		successors = model.successors.tolist()
+		probabilities = model.probabilities.tolist()
+		for i in np.flatnonzero(~self.isNode):
+			for a in range(len(ACTIONS)):
+				for j, p in zip(successors[i][a], probabilities[i][a]):
+					if j == i:
+						self.toSelf[i, a] += p
+					elif j == self.before[i]:
+						self.toBefore[i, a] += p
+					else:
+						self.toAfter[i, a] += p
+
+	def numberOfNodes(self):
+		return int(self.isNode.sum())
+
+	def segments(self, frozen):
+		# Splits the chains at frozen squares (terminal food, ghosts,
+		# capsules), which have known values just like nodes do.
+		#
+		# Returns (squares, lengths, beforeEnds, afterEnds): squares is a
+		# (segments, longest) array of the link squares of each segment,
+		# padded with -1, and the ends are the square with a known or
+		# separately solved value on either side of each segment.
+		runs = []
+		for chain, (beforeEnd, afterEnd) in zip(self.chains, self.chainEnds):
+			run = []
+			left = beforeEnd
+			for square in chain.tolist():
+				if frozen[square]:
+					if run:
+						runs.append((left, run, square))
+						run = []
+					left = square
+				else:
+					run.append(square)
+			if run:
+				runs.append((left, run, afterEnd))
+
+		longest = max([len(run) for (left, run, right) in runs] + [0])
+		squares = -np.ones((len(runs), longest), dtype=int)
+		for k, (left, run, right) in enumerate(runs):
+			squares[k, :len(run)] = run
+		lengths = np.array([len(run) for (left, run, right) in runs], dtype=int)
+		beforeEnds = np.array([left for (left, run, right) in runs], dtype=int)
+		afterEnds = np.array([right for (left, run, right) in runs], dtype=int)
+		return squares, lengths, beforeEnds, afterEnds
+
+	def solveSegments(self, segments, policy, reward, gamma):
+		# With the links following policy, the utility of every link in a
+		# segment is an affine function of the utilities at its two ends:
+		#
+		#   U(s) = constant(s) + fromBefore(s) * U(before end) + fromAfter(s) * U(after end)
+		#
+		# Each segment is a tridiagonal linear system. They are solved all
+		# at once with the Thomas algorithm, one position along the
+		# segments at a time.
+		#
+		# Returns (constant, fromBefore, fromAfter, beforeEnd, afterEnd) as
+		# arrays over all squares (zero, or -1 for the ends, on squares
+		# outside the segments).
+		squares, lengths, beforeEnds, afterEnds = segments
+		count, longest = squares.shape
+		n = len(self.isNode)
+		constant = np.zeros(n)
+		fromBefore = np.zeros(n)
+		fromAfter = np.zeros(n)
+		beforeEnd = -np.ones(n, dtype=int)
+		afterEnd = -np.ones(n, dtype=int)
+		if count == 0:
+			return constant, fromBefore, fromAfter, beforeEnd, afterEnd
+
+		real = squares >= 0
+		safe = np.where(real, squares, 0)
+		actions = policy[safe]
+		lower = np.where(real, -gamma * self.toBefore[safe, actions], 0.0)
+		diagonal = np.where(real, 1 - gamma * self.toSelf[safe, actions], 1.0)
+		upper = np.where(real, -gamma * self.toAfter[safe, actions], 0.0)
+
+		# Right-hand sides: the reward, and the coefficients of the two ends
+		rhs = np.zeros((count, longest, 3))
+		if np.isscalar(reward):
+			rhs[:, :, 0] = np.where(real, reward, 0.0)
+		else:
+			rhs[:, :, 0] = np.where(real, reward[safe], 0.0)
+		rows = np.arange(count)
+		last = lengths - 1
+		rhs[:, 0, 1] = -lower[:, 0]
+		lower[:, 0] = 0
+		rhs[rows, last, 2] = -upper[rows, last]
+		upper[rows, last] = 0
+
+		# Forward elimination
+		for k in range(1, longest):
+			w = lower[:, k] / diagonal[:, k - 1]
+			diagonal[:, k] -= w * upper[:, k - 1]
+			rhs[:, k] -= w[:, None] * rhs[:, k - 1]
+		# Back substitution
+		x = np.zeros((count, longest, 3))
+		x[:, longest - 1] = rhs[:, longest - 1] / diagonal[:, longest - 1, None]
+		for k in range(longest - 2, -1, -1):
+			x[:, k] = (rhs[:, k] - upper[:, k, None] * x[:, k + 1]) / diagonal[:, k, None]
+
+		links = squares[real]
+		constant[links] = x[real][:, 0]
+		fromBefore[links] = x[real][:, 1]
+		fromAfter[links] = x[real][:, 2]
+		beforeEnd[links] = np.repeat(beforeEnds, lengths)
+		afterEnd[links] = np.repeat(afterEnds, lengths)
+		return constant, fromBefore, fromAfter, beforeEnd, afterEnd
+
+# Layout models are built once and shared between moves and games. The
+# game hands agents a fresh copy of the layout every move, so they are
+# looked up by the wall positions rather than by the layout object.
+_layoutModels = {}
+
+def getLayoutModel(wallList, width, height):
+	key = (width, height, tuple(wallList))
+	if key not in _layoutModels:
+		_layoutModels[key] = LayoutModel(wallList, width, height)
+	return _layoutModels[key]
+
+#
+# Bellman backups
+#
+# Every solver takes an optional deadline, a time.time() value. Once it
+# has passed the solver stops at the end of its current sweep (or round,
+# or batch of backups) and returns what it has, so that MDPAgent can keep
+# to the game's time limit for a move. Utilities after any number of
+# sweeps still give a policy, just a less considered one.
+def outOfTime(deadline):
+	return deadline is not None and time.time() >= deadline
+
+def convergenceThreshold(epsilon, gamma):
+	# Value iteration can stop once the largest change in a sweep (the
+	# max-norm Bellman residual) is below epsilon * (1 - gamma) / gamma:
+	# the utilities are then within epsilon of the true ones.
+	#
+	# With gamma = 1 there is no such guarantee and the threshold is 0,
+	# so only the iteration cap stops the solver.
+	return epsilon * (1 - gamma) / gamma
+
+def valueIteration(model, V, frozen, reward, gamma, epsilon, maxIterations, deadline=None):
+	# Runs synchronous sweeps of the Bellman update
+	#
+	#   U(s) = reward + gamma * max_a sum_s' P(s' | s, a) U(s')
+	#
+	# over every square of the LayoutModel that is not frozen (terminal
+	# food, ghosts, capsules) until the residual drops below the
+	# threshold from convergenceThreshold, or maxIterations sweeps have
+	# been done, or the deadline has passed.
+	#
+	# V and frozen are flat arrays over the model's free squares; reward
+	# may be a number or such an array. Returns the new utilities, the
+	# number of sweeps and the residual of the last sweep.
+	if not (0 < gamma <= 1):
+		raise ValueError("MDP must have a gamma between 0 and 1.")
+
+	update = ~frozen
+	threshold = convergenceThreshold(epsilon, gamma)
+
+	sweeps = 0
+	residual = float("inf")
+	while sweeps < maxIterations and residual >= threshold and not outOfTime(deadline):
+		meu = model.expectedUtilities(V).max(axis=1)
+		newV = np.where(update, reward + gamma * meu, V)
+		residual = float(np.abs(newV - V).max())
+		V = newV
+		sweeps += 1
+	return V, sweeps, residual
+
+# Prioritized sweeping looks at the clock once per this many backups
+DEADLINE_BACKUPS = 256
+
+def prioritizedSweeping(model, V, frozen, reward, gamma, epsilon, maxBackups, changed=None, deadline=None):
+	# Asynchronous value iteration. Squares are backed up one at a time,
+	# in place (so each backup sees the newest values, as in
+	# Gauss-Seidel), in order of their Bellman error: the square whose
+	# utility is furthest from its one-step lookahead goes first. After a
+	# backup, the squares that can move into it are re-queued with their
+	# new error.
+	#
+	# changed is a boolean array marking the squares whose reward or
+	# frozen status changed since V was last solved; the search starts
+	# from those and their neighbours. Without it every square is queued.
+	#
+	# Stops when no queued square has an error of at least the
+	# convergenceThreshold, or after maxBackups backups. The deadline is
+	# checked every DEADLINE_BACKUPS backups. Returns the new utilities (V
+	# is not modified) and the number of backups.
+	if not (0 < gamma <= 1):
+		raise ValueError("MDP must have a gamma between 0 and 1.")
+
+	threshold = convergenceThreshold(epsilon, gamma)
+	successors, probabilities = model.getTransitionLists()
+	predecessors = model.getPredecessors()
+	values = V.tolist()
+	isFrozen = frozen.tolist()
+	if np.isscalar(reward):
+		rewards = [reward] * len(values)
+	else:
+		rewards = reward.tolist()
+
+	def backup(i):
+		best = None
+		for actionSuccessors, actionProbabilities in zip(successors[i], probabilities[i]):
+			expected = 0.0
+			for j, p in zip(actionSuccessors, actionProbabilities):
+				expected += p * values[j]
+			if best is None or expected > best:
+				best = expected
+		return rewards[i] + gamma * best
+
+	if changed is None:
+		candidates = range(len(values))
+	else:
+		candidates = set()
+		for i in np.flatnonzero(changed):
+			candidates.add(i)
+			candidates.update(predecessors[i])
+
+	# heapq is a min-heap, so errors are pushed negated. priority holds
+	# the latest error pushed for each square so stale entries can be
+	# skipped when they come off the heap.
+	queue = []
+	priority = [0.0] * len(values)
+	for i in candidates:
+		if not isFrozen[i]:
+			error = abs(backup(i) - values[i])
+			if error >= threshold:
+				priority[i] = error
+				queue.append((-error, i))
+	heapq.heapify(queue)
+
+	backups = 0
+	while queue and backups < maxBackups:
+		if backups % DEADLINE_BACKUPS == 0 and outOfTime(deadline):
+			break
+		error, i = heapq.heappop(queue)
+		if -error != priority[i]:
+			continue
+		priority[i] = 0.0
+		values[i] = backup(i)
+		backups += 1
+
+		for p in predecessors[i]:
+			if not isFrozen[p]:
+				error = abs(backup(p) - values[p])
+				if error >= threshold and error > priority[p]:
+					priority[p] = error
+					heapq.heappush(queue, (-error, p))
+	return np.array(values), backups
+
+# The incremental solver falls back to full sweeps when more than this
+# fraction of the squares changed since the last solve.
+INCREMENTAL_LIMIT = 0.25
+
+def incrementalValueIteration(model, V, frozen, reward, gamma, epsilon, maxIterations, changed, deadline=None):
+	# Re-solves after a small change, e.g. when only the ghosts moved or
+	# Pacman ate one pellet. V should hold the utilities of the last solve
+	# and changed marks the squares whose reward or frozen status has
+	# changed since then.
+	#
+	# Sweeps are limited to a dirty region: it starts as the changed
+	# squares and their predecessors, and each sweep moves on to the
+	# predecessors of the squares whose utility changed by at least the
+	# convergenceThreshold. The solve ends when the region is empty.
+	#
+	# If more than INCREMENTAL_LIMIT of the squares changed, this is just
+	# valueIteration. Returns the new utilities, the number of sweeps and
+	# the number of backups done.
+	if not (0 < gamma <= 1):
+		raise ValueError("MDP must have a gamma between 0 and 1.")
+
+	if changed.sum() > INCREMENTAL_LIMIT * model.size():
+		V, sweeps, residual = valueIteration(model, V, frozen, reward, gamma, epsilon, maxIterations, deadline)
+		return V, sweeps, sweeps * int((~frozen).sum())
+
+	threshold = convergenceThreshold(epsilon, gamma)
+	if not np.isscalar(reward):
+		reward = np.asarray(reward)
+
+	V = V.copy()
+	# The changed squares have to be swept themselves, not just their
+	# predecessors: a square that stops being frozen only is one of its own
+	# predecessors if it is next to a wall
+	changedSquares = np.flatnonzero(changed)
+	region = np.union1d(changedSquares, model.predecessorsOf(changedSquares))
+	region = region[~frozen[region]]
+	sweeps = 0
+	backups = 0
+	while len(region) > 0 and sweeps < maxIterations and not outOfTime(deadline):
+		Q = (model.probabilities[region] * V[model.successors[region]]).sum(axis=2)
+		if np.isscalar(reward):
+			newValues = reward + gamma * Q.max(axis=1)
+		else:
+			newValues = reward[region] + gamma * Q.max(axis=1)
+		moved = region[np.abs(newValues - V[region]) >= threshold]
+		V[region] = newValues
+		sweeps += 1
+		backups += len(region)
+
+		region = model.predecessorsOf(moved)
+		region = region[~frozen[region]]
+	return V, sweeps, backups
+
+def multigridValueIteration(model, V, frozen, reward, gamma, epsilon, maxIterations, deadline=None):
+	# Coarse-to-fine value iteration. On a big layout value iteration
+	# needs about one sweep per square of distance for a reward to be
+	# felt, so squares far from any food start with poor utilities for a
+	# long time. Here the problem is first solved on the coarsest model
+	# of model.getHierarchy(), where distances are much shorter, and each
+	# solution is spread back out as the starting point for the next
+	# finer level, ending with ordinary valueIteration on the full model.
+	#
+	# Each coarsening halves distances, so a level k steps up is
+	# discounted by gamma ** (2 ** k), and the per-move reward grows to
+	# match. Coarse levels only give a starting guess, so they are solved
+	# to the same epsilon without needing to be exact.
+	#
+	# Returns the utilities, the number of sweeps on the full model, and
+	# the total work in full-model sweeps (coarse sweeps count in
+	# proportion to the size of their level).
+	if not (0 < gamma <= 1):
+		raise ValueError("MDP must have a gamma between 0 and 1.")
+
+	hierarchy = model.getHierarchy()
+	values = [V]
+	frozens = [frozen]
+	for coarse in hierarchy[1:]:
+		coarseV, coarseFrozen = coarse.restrict(values[-1], frozens[-1])
+		values.append(coarseV)
+		frozens.append(coarseFrozen)
+
+	work = 0.0
+	guess = values[-1]
+	for level in range(len(hierarchy) - 1, 0, -1):
+		steps = 2 ** level
+		levelGamma = gamma ** steps
+		if np.isscalar(reward):
+			levelReward = reward * sum(gamma ** k for k in range(steps))
+		else:
+			levelReward = reward.mean() * sum(gamma ** k for k in range(steps))
+		guess, sweeps, residual = valueIteration(hierarchy[level], guess, frozens[level], levelReward, levelGamma, epsilon, maxIterations, deadline)
+		work += sweeps * float(hierarchy[level].size()) / model.size()
+		guess = hierarchy[level].prolong(guess, frozens[level], values[level - 1], frozens[level - 1])
+
+	V, sweeps, residual = valueIteration(model, guess, frozen, reward, gamma, epsilon, maxIterations, deadline)
+	return V, sweeps, work + sweeps
+
+def corridorValueIteration(model, V, frozen, reward, gamma, epsilon, maxIterations, deadline=None):
+	# Value iteration on the layout with its corridors collapsed (see
+	# CorridorGraph). Only nodes are backed up; the links between them are
+	# solved exactly by CorridorGraph.solveSegments, so a change at one end
+	# of a corridor reaches the other end in a single sweep.
+	#
+	# Segment solutions need a fixed action for every link, so each sweep
+	#
+	# 1) solves the segments for the current link actions,
+	# 2) backs up the nodes, reading the links next to them off the
+	#    segment solutions,
+	# 3) fills in every link and switches each one to its greedy action.
+	#
+	# This stops once the node residual is below the convergenceThreshold
+	# and no link changed action, or after maxIterations sweeps. The first
+	# link actions are greedy with respect to V.
+	#
+	# Returns the utilities, the number of sweeps and the total work in
+	# full-layout sweeps (node backups count in proportion to the squares
+	# they touch; solving, filling in and improving the links counts as
+	# two backups per link).
+	if not (0 < gamma <= 1):
+		raise ValueError("MDP must have a gamma between 0 and 1.")
+
+	graph = model.getCorridorGraph()
+	threshold = convergenceThreshold(epsilon, gamma)
+	segments = graph.segments(frozen)
+
+	V = V.copy()
+	anchors = graph.isNode | frozen
+	links = np.flatnonzero(~anchors)
+	nodes = np.flatnonzero(anchors & ~frozen)
+	# Links whose values the node backups need
+	nodeSuccessors = np.unique(model.successors[nodes])
+	edge = nodeSuccessors[~anchors[nodeSuccessors]]
+	if np.isscalar(reward):
+		nodeReward = reward
+	else:
+		nodeReward = reward[nodes]
+	sweepWork = (len(nodes) + len(edge) + 2.0 * len(links)) / model.size()
+
+	policy = greedyPolicy(model, V)
+	sweeps = 0
+	while sweeps < maxIterations and not outOfTime(deadline):
+		constant, fromBefore, fromAfter, beforeEnd, afterEnd = graph.solveSegments(segments, policy, reward, gamma)
+
+		residual = 0.0
+		if len(nodes) > 0:
+			V[edge] = constant[edge] + fromBefore[edge] * V[beforeEnd[edge]] + fromAfter[edge] * V[afterEnd[edge]]
+			Q = (model.probabilities[nodes] * V[model.successors[nodes]]).sum(axis=2)
+			newValues = nodeReward + gamma * Q.max(axis=1)
+			residual = float(np.abs(newValues - V[nodes]).max())
+			V[nodes] = newValues
+
+		V[links] = constant[links] + fromBefore[links] * V[beforeEnd[links]] + fromAfter[links] * V[afterEnd[links]]
+		sweeps += 1
+
+		newPolicy = greedyPolicy(model, V, policy)
+		stable = np.array_equal(newPolicy[links], policy[links])
+		policy = newPolicy
+		if stable and residual < threshold:
+			break
+	return V, sweeps, sweeps * sweepWork
+
+def greedyPolicy(model, V, policy=None):
+	# The action in ACTIONS (as an index) with the highest expected
+	# utility from every square. If a current policy is given, a square
+	# only switches action when another one is strictly better, so that
+	# ties cannot make policy iteration cycle.
+	Q = model.expectedUtilities(V)
+	best = Q.argmax(axis=1)
+	if policy is None:
+		return best
+	rows = np.arange(len(best))
+	keep = Q[rows, policy] >= Q[rows, best] - 1e-12
+	return np.where(keep, policy, best)
+
+def evaluatePolicy(model, V, frozen, reward, gamma, policy):
+	# Exact utilities of following policy (an action index per square):
+	# solves the linear system
+	#
+	#   U(s) - gamma * sum_s' P(s' | s, policy(s)) U(s') = reward
+	#
+	# for the squares that are not frozen. Frozen squares keep their
+	# values from V and move to the right-hand side.
+	n = model.size()
+	free = np.flatnonzero(~frozen)
+	fixed = np.flatnonzero(frozen)
+	# Position of each free square among the unknowns
+	position = -np.ones(n, dtype=int)
+	position[free] = np.arange(len(free))
+
+	successors = model.successors[free, policy[free]]
+	probabilities = model.probabilities[free, policy[free]]
+	rows = np.repeat(np.arange(len(free)), successors.shape[1])
+	cols = successors.ravel()
+	data = probabilities.ravel()
+
+	# Transitions into frozen squares are known values
+	toFree = position[cols] >= 0
+	b = np.zeros(len(free))
+	if np.isscalar(reward):
+		b += reward
+	else:
+		b += reward[free]
+	np.add.at(b, rows[~toFree], gamma * data[~toFree] * V[cols[~toFree]])
+
+	rows = rows[toFree]
+	cols = position[cols[toFree]]
+	data = data[toFree]
+
+	if scipy is not None:
+		P = scipy.sparse.csr_matrix((data, (rows, cols)), shape=(len(free), len(free)))
+		A = scipy.sparse.identity(len(free), format="csr") - gamma * P
+		solution = scipy.sparse.linalg.spsolve(A.tocsc(), b)
+	else:
+		A = np.identity(len(free))
+		np.add.at(A, (rows, cols), -gamma * data)
+		solution = np.linalg.solve(A, b)
+
+	U = np.empty(n)
+	U[fixed] = V[fixed]
+	U[free] = solution
+	return U
+
+def policyIteration(model, V, frozen, reward, gamma, maxIterations, deadline=None):
+	# Alternates exact policy evaluation (evaluatePolicy) with greedy
+	# improvement until the policy stops changing, or maxIterations
+	# rounds have been done. The first policy is greedy with respect to
+	# V, so a warm V usually needs only one or two rounds.
+	#
+	# Returns the utilities of the final policy and the number of rounds.
+	if not (0 < gamma <= 1):
+		raise ValueError("MDP must have a gamma between 0 and 1.")
+
+	policy = greedyPolicy(model, V)
+	rounds = 0
+	while rounds < maxIterations and not outOfTime(deadline):
+		V = evaluatePolicy(model, V, frozen, reward, gamma, policy)
+		rounds += 1
+		newPolicy = greedyPolicy(model, V, policy)
+		if np.array_equal(newPolicy[~frozen], policy[~frozen]):
+			break
+		policy = newPolicy
+	return V, rounds
+
+def bellmanResidual(model, V, frozen, reward, gamma):
+	# The largest change one more synchronous sweep would make to V, i.e.
+	# how far V is from being converged
+	if model.size() == 0:
+		return 0.0
+	meu = model.expectedUtilities(V).max(axis=1)
+	return float(np.abs(np.where(frozen, V, reward + gamma * meu) - V).max())
@@ -0,0 +1,190 @@
+# mdpTables.py
+#
+# Exact policies for small layouts without ghosts, worked out offline.
+#
+# Without ghosts the whole game state is Pacman's square plus the food
+# that is left, so on a layout with few enough pellets every state can
+# be listed and the game solved exactly, once. The MDP here is the game
+# itself: Pacman moves with the api.directionProb motion model (see
+# mdpSolver.LayoutModel), every move costs 1 point, a pellet is worth 10
+# and clearing the board another 500, which ends the game. Capsules are
+# worth nothing without ghosts to eat, so they are left out.
+#
+# States are numbered mask * n + i, where i is Pacman's square among the
+# n free squares of the LayoutModel and bit k of mask is set while the
+# k-th pellet (in square order) is still there. There are n * 2 ** food
+# of them, so the tool refuses layouts with more than MAX_STATES (e.g.
+# mediumMDPNoGhosts, whose 99 pellets would need 106 * 2 ** 99).
+#
+# The policy is written as two files:
+#
+# <name>.npy   the best action for every state, as an index into
+#              mdpSolver.ACTIONS packed four to a byte, read with
+#              numpy's memory mapping so loading costs nothing
+# <name>.json  the layout the table is for and how states are numbered
+#
+# MDPAgent plays from a table with -a solver=table,table=<name>.
+#
+# To run:
+#
+# python mdpTables.py -l smallMDPGrid -o smallMDPGrid
+
+import json
+import time
+from optparse import OptionParser
+
+import numpy as np
+import layout
+import mdpCache
+import mdpSolver
+
+# Score changes, as in pacman.py
+MOVE_SCORE = -1
+FOOD_SCORE = 10
+WIN_SCORE = 500
+
+# Largest number of states the tool will solve
+MAX_STATES = 1 << 22
+
+def solveLayout(model, foodCells, gamma, epsilon, maxIterations):
+	# Value iteration over every (food left, Pacman's square) state.
+	# foodCells are the indices in model of the squares with pellets.
+	# Returns the policy and utilities as (2 ** food, n) arrays, and the
+	# number of sweeps.
+	n = model.size()
+	masks = np.arange(1 << len(foodCells))[:, None]
+	foodBit = np.zeros(n, dtype=np.int64)
+	foodBit[foodCells] = 1 << np.arange(len(foodCells))
+
+	# What landing on each square does, for every mask: the food left
+	# afterwards and the score for the move
+	newMask = masks & ~foodBit[None, :]
+	ate = (masks & foodBit[None, :]) != 0
+	reward = MOVE_SCORE + FOOD_SCORE * ate + WIN_SCORE * (ate & (newMask == 0))
+	columns = np.arange(n)[None, :]
+
+	V = np.zeros((len(masks), n))
+	Q = np.zeros((len(masks), n, len(mdpSolver.ACTIONS)))
+	sweeps = 0
+	residual = float("inf")
+	while sweeps < maxIterations and residual >= epsilon:
+		landing = reward + gamma * V[newMask, columns]
+		for a in range(len(mdpSolver.ACTIONS)):
+			Q[:, :, a] = (model.probabilities[None, :, a, :] * landing[:, model.successors[:, a, :]]).sum(axis=2)
+		newV = Q.max(axis=2)
+		# No food left: the game is over
+		newV[0] = 0
+		residual = float(np.abs(newV - V).max())
+		V = newV
+		sweeps += 1
+	return Q.argmax(axis=2), V, sweeps
+
+def packPolicy(policy):
+	# Four 2-bit actions to a byte, the first in the lowest bits
+	flat = policy.ravel().astype(np.uint8)
+	flat = np.concatenate([flat, np.zeros(-len(flat) % 4, dtype=np.uint8)])
+	return flat[0::4] | (flat[1::4] << 2) | (flat[2::4] << 4) | (flat[3::4] << 6)
+
+def writeTable(name, board, gamma, epsilon, maxIterations):
+	# Solves a layout.Layout and writes its table. Returns a line
+	# describing the solve.
+	if board.getNumGhosts() > 0:
+		raise Exception("Exact tables are only for layouts without ghosts")
+
+	walls = board.walls.asList()
+	model = mdpSolver.LayoutModel(walls, board.width, board.height)
+	food = sorted(board.food.asList(), key=lambda cell: model.index[cell])
+	foodCells = [model.index[cell] for cell in food]
+	states = model.size() << len(food)
+	if states > MAX_STATES:
+		raise Exception("%d squares and %d pellets make %d states, more than the %d allowed" % (
+			model.size(), len(food), states, MAX_STATES))
+
+	start = time.time()
+	policy, V, sweeps = solveLayout(model, foodCells, gamma, epsilon, maxIterations)
+	taken = time.time() - start
+
+	np.save(name + ".npy", packPolicy(policy))
+	info = {"width": board.width,
+			"height": board.height,
+			"fingerprint": mdpCache.layoutFingerprint(board.width, board.height, walls),
+			"cells": model.cells,
+			"food": food,
+			"gamma": gamma}
+	f = open(name + ".json", "w")
+	try:
+		json.dump(info, f)
+	finally:
+		f.close()
+
+	pacmanCell = model.index[board.agentPositions[0][1]]
+	expected = V[(1 << len(food)) - 1, pacmanCell]
+	return "%d states, %d sweeps, %.2fs, expected score from the start %.1f" % (states, sweeps, taken, expected)
+
+class PolicyTable:
+
+	# A table written by writeTable, for looking up moves during a game.
+	def __init__(self, name):
+		f = open(name + ".json")
+		try:
+			info = json.load(f)
+		finally:
+			f.close()
+		self.width = info["width"]
+		self.height = info["height"]
+		self.fingerprint = info["fingerprint"]
+		self.food = [tuple(cell) for cell in info["food"]]
+		self.index = dict((tuple(cell), i) for i, cell in enumerate(info["cells"]))
+		self.foodBit = dict((cell, 1 << k) for k, cell in enumerate(self.food))
+		self.size = len(self.index)
+		self.packed = np.load(name + ".npy", mmap_mode="r")
+
+	def fullMask(self):
+		# The mask with every pellet still there
+		return (1 << len(self.food)) - 1
+
+	def eat(self, mask, position):
+		# The mask after Pacman has been on position
+		return mask & ~self.foodBit.get(position, 0)
+
+	def actionFor(self, position, mask):
+		state = mask * self.size + self.index[position]
+		action = (int(self.packed[state >> 2]) >> (2 * (state & 3))) & 3
+		return mdpSolver.ACTIONS[action]
+
+# Tables are loaded once per program, by name
+_tables = {}
+
+def getPolicyTable(name):
+	if name not in _tables:
+		_tables[name] = PolicyTable(name)
+	return _tables[name]
+
+def readCommand(argv):
+	parser = OptionParser(usage="python mdpTables.py [options]")
+	parser.add_option('-l', '--layout', dest='layout',
+					help='layout to solve [Default: %default]', default='smallMDPGrid')
+	parser.add_option('-o', '--output', dest='output',
+					help='name of the table files, without .npy/.json [Default: the layout name]')
+	parser.add_option('-g', '--gamma', dest='gamma', type='float',
+					help='discount factor [Default: %default]', default=1.0)
+	parser.add_option('-e', '--epsilon', dest='epsilon', type='float',
+					help='stop once no utility changes by this much in a sweep [Default: %default]', default=1e-6)
+	parser.add_option('-m', '--maxIterations', dest='maxIterations', type='int',
+					help='cap on sweeps [Default: %default]', default=100000)
+	options, otherjunk = parser.parse_args(argv)
+	if len(otherjunk) != 0:
+		raise Exception('Command line input not understood: ' + str(otherjunk))
+	if options.output is None:
+		options.output = options.layout
+	return options
+
+def runTables(options):
+	board = layout.getLayout(options.layout)
+	if board is None:
+		raise Exception("The layout " + options.layout + " cannot be found")
+	print options.layout + ":", writeTable(options.output, board, options.gamma, options.epsilon, options.maxIterations)
+
+if __name__ == '__main__':
+	import sys
+	runTables(readCommand(sys.argv[1:]))
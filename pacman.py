@@ -509,6 +509,8 @@ def readCommand( argv ):
                       help=default('Zoom the size of the graphics window'), default=1.0)
     parser.add_option('-f', '--fixRandomSeed', action='store_true', dest='fixRandomSeed',
                       help='Fixes the random seed to always play the same game', default=False)
+    parser.add_option('-s', '--seed', dest='seed', type='int',
+                      help=default('Seeds separate random streams for Pacman\'s moves and each ghost. The games of a run use seed, seed + 1 and so on, and each can be played again alone with -n 1 -s <its seed>'), default=None)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
@@ -568,6 +570,7 @@ def readCommand( argv ):
         args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime = options.frameTime)
     args['numGames'] = options.numGames
     args['record'] = options.record
+    args['seed'] = options.seed
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
 
@@ -625,9 +628,10 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, seed=None ):
     import __main__
     __main__.__dict__['_display'] = display
+    import api, randomStreams
 
     rules = ClassicGameRules(timeout)
     games = []
@@ -642,8 +646,21 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         else:
             gameDisplay = display
             rules.quiet = False
+
+        # With a seed, Pacman's moves and each ghost draw from streams of
+        # their own, seeded from the game's seed
+        gameSeed = None
+        if seed is not None:
+            gameSeed = seed + i
+            moves, ghostStreams = randomStreams.gameStreams(gameSeed, [ghost.index for ghost in ghosts])
+            api.seedMoves(moves)
+            for ghost in ghosts:
+                if hasattr(ghost, 'seedStream'): ghost.seedStream(ghostStreams[ghost.index])
+
         game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
         game.run()
+        if gameSeed is not None and not beQuiet:
+            print 'Game %d seed: %d' % (i + 1, gameSeed)
         if not beQuiet: games.append(game)
 
         if record:
@@ -0,0 +1,49 @@
+# randomStreams.py
+#
+# Separate, seeded streams of random numbers for the parts of a game
+# that draw them: Pacman's action noise in api.makeMove and each ghost's
+# choice of move.
+#
+# Everything used to draw from the global random module, so fixing its
+# seed (pacman.py -f) fixed every game at once, and anything that drew
+# one more or one fewer number (a different agent, another ghost)
+# changed everything after it. Each stream here has its own generator,
+# seeded from the game's seed and the stream's name, so a stream gives
+# the same numbers whatever the rest of the game does, and a game can be
+# played again exactly from its seed (pacman.py -s).
+#
+# A stream draws BLOCK numbers at a time and hands them out one by one.
+
+import hashlib
+import random
+
+BLOCK = 1024
+
+class RandomStream:
+
+	# Draws numbers in [0, 1) from a random.Random seeded with seed
+	def __init__(self, seed, block=BLOCK):
+		self.generator = random.Random(seed)
+		self.block = block
+		self.numbers = []
+		self.next = 0
+
+	def random(self):
+		if self.next == len(self.numbers):
+			draw = self.generator.random
+			self.numbers = [draw() for i in range(self.block)]
+			self.next = 0
+		number = self.numbers[self.next]
+		self.next += 1
+		return number
+
+def deriveSeed(seed, name):
+	# The seed of the stream called name in a game with the given seed.
+	# Different names give unrelated seeds
+	return int(hashlib.sha1("%d:%s" % (seed, name)).hexdigest()[:16], 16)
+
+def gameStreams(seed, ghostIndices):
+	# The streams for one game: Pacman's moves, and each ghost's by index
+	moves = RandomStream(deriveSeed(seed, "pacman"))
+	ghosts = dict((index, RandomStream(deriveSeed(seed, "ghost%d" % index))) for index in ghostIndices)
+	return moves, ghosts
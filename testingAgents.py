@@ -34,6 +34,7 @@ import api
 import random
 import game
 import util
+from valueMap import ValueMap
 
 class Grid:
 
@@ -156,7 +157,7 @@ class TestingAgent(Agent):
 			self.map.setValue(walls[i][0], walls[i][1], "#")
 
 	def makeValueMap(self, state):
-		# This function returns a dictionary of all possible coordinates on a grid
+		# This function returns a ValueMap of all possible coordinates on a grid
 		# As well as all the values that are assigned to each coordinate-category
 		# Food is given a value of 5
 		# Empty spaces are given a value of 0
@@ -188,27 +189,15 @@ class TestingAgent(Agent):
 				self.capsuleMap.append(i)
 
 
-		# Create a dictionary storing all
-		# Food, wall and capsule locations, while assigning values to them
-		self.foodDict = dict.fromkeys(self.foodMap, 5)
-		self.wallDict = dict.fromkeys(self.wallMap, '#')
-		self.capsuleDict = dict.fromkeys(self.capsuleMap, 5)
-
-		# Initiate valueMap to store all coordinates
-		valueMap = {}
-		valueMap.update(self.foodDict)
-		valueMap.update(self.wallDict)
-		valueMap.update(self.capsuleDict)
-
-		# Using the APIs to get coordinates tends to leave out pacman
-		# Initial position
-		# This will sweep through all available coordinates
-		# And add the square to the list with 0
+		# Create a value map of the grid with the walls marked in it
+		# And assign values to the food and capsule locations
+		# Every other square starts at 0
+		valueMap = ValueMap(self.getLayoutWidth(corners), self.getLayoutHeight(corners), self.wallMap)
+		for i in self.foodMap:
+			valueMap[i] = 5
 
-		for i in range(self.getLayoutWidth(corners) - 1):
-			for j in range(self.getLayoutHeight(corners) - 1):
-				if (i, j) not in valueMap.keys():
-					valueMap[(i, j)] = 0
+		for i in self.capsuleMap:
+			valueMap[i] = 5
 
 		# Update function. If pacman has been seen to visit a square
 		# It means he has eaten the food or capsules there
@@ -226,14 +215,14 @@ class TestingAgent(Agent):
 		ghosts = api.ghosts(state)
 		ghostStates = api.ghostStatesWithTimes(state)
 
-		for i in valueMap.keys():
-			for j in range(len(ghosts)):
-				ghostTime = ghostStates[j][1]
-				#Convert coordinates to int (keys are stored as int, but coordinates from API are stored as float)
-				if ((int(ghosts[j][0])), (int(ghosts[j][1]))) == i:
-					valueMap[i] = -10
-				#elif ((int(ghosts[j][0])), (int(ghosts[j][1]))) == i and ghostTime >= 5:
-				#	valueMap[i] = 5
+		for j in range(len(ghosts)):
+			ghostTime = ghostStates[j][1]
+			#Convert coordinates to int (squares are indexed by int, but coordinates from API are stored as float)
+			ghost = ((int(ghosts[j][0])), (int(ghosts[j][1])))
+			if ghost in valueMap and not valueMap.isWall(ghost[0], ghost[1]):
+				valueMap[ghost] = -10
+			#elif ghostTime >= 5:
+			#	valueMap[ghost] = 5
 
 		return valueMap
 
@@ -243,103 +232,34 @@ class TestingAgent(Agent):
 		# An sets the value of the coordinate to the MEU
 		# Which will then later be used as the transition value during value iteration
 
-		# initialise a dictionary to store utility values
-		self.util_dict = {"n_util": 0.0, "s_util": 0.0, "e_util": 0.0, "w_util": 0.0}
-		# valueMap should be a dictionary containing a list of values assigned to every grid
+		# valueMap should be a ValueMap holding the values assigned to every grid
 		self.valueMap = valueMap
 
 		self.x = x
 		self.y = y
 
-		north = (self.x, self.y + 1)
-		south = (self.x, self.y - 1)
-		east = (self.x + 1, self.y)
-		west = (self.x - 1, self.y)
-		stay = (self.x, self.y)
-
-
-		# If North is not a wall, then multiply expected utility;
-		# else multiply expected utility of staying in place
-		# If the perpendicular directions are not walls, then multiply expected utility of those
-		# else multiply expected utility of just staying in place
-
-		if self.valueMap[north] != "#":
-			n_util = (0.8 * self.valueMap[north])
-		else:
-			n_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[east] != "#":
-			n_util += (0.1 * self.valueMap[east])
-		else:
-			n_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			n_util += (0.1 * self.valueMap[west])
-		else:
-			n_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["n_util"] = n_util
-
-
-		# Repeat for the rest of the directions
-		if self.valueMap[south] != "#":
-			s_util = (0.8 * self.valueMap[south])
-		else:
-			s_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[east] != "#":
-			s_util += (0.1 * self.valueMap[east])
-		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			s_util += (0.1 * self.valueMap[west])
-		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["s_util"] = s_util
-
-
-		if self.valueMap[east] != "#":
-			e_util = (0.8 * self.valueMap[east])
-		else:
-			e_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[north] != "#":
-			e_util += (0.1 * self.valueMap[north])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[south] != "#":
-			e_util += (0.1 * self.valueMap[south])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["e_util"] = e_util
-
-		if self.valueMap[west] != "#":
-			w_util = (0.8 * self.valueMap[west])
-		else:
-			w_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[north] != "#":
-			w_util += (0.1 * self.valueMap[north])
-		else:
-			w_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[south] != "#":
-			w_util += (0.1 * self.valueMap[south])
-		else:
-			w_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["w_util"] = w_util
+		self.util_dict = self.getExpectedUtilities(valueMap, x, y)
 
 		# Take the max value in the dictionary of stored utilities
 		# Assign current grid MEU
 		# Return updated valueMap that has transition values
-		self.valueMap[stay] = max(self.util_dict.values())
+		stay = valueMap.indexOf(x, y)
+		valueMap.values[stay] = max(self.util_dict.values())
+
+		return valueMap.values[stay]
 
-		return self.valueMap[stay]
+	def getExpectedUtilities(self, valueMap, x, y):
+		# Returns a dictionary with the expected utility of moving in each direction from (x, y)
+		# Pacman goes the intended way with probability 0.8 and slips to either side with 0.1
+		# The neighbour table of the valueMap already has moves into walls replaced by
+		# staying in place, so the utilities are read straight from its flat array
+		values = valueMap.values
+		north, south, east, west = valueMap.neighbours[valueMap.indexOf(x, y)]
+
+		return {"n_util": 0.8 * values[north] + 0.1 * values[east] + 0.1 * values[west],
+				"s_util": 0.8 * values[south] + 0.1 * values[east] + 0.1 * values[west],
+				"e_util": 0.8 * values[east] + 0.1 * values[north] + 0.1 * values[south],
+				"w_util": 0.8 * values[west] + 0.1 * values[north] + 0.1 * values[south]}
 
 
 	def valueIteration(self, state, reward, gamma, V1):
@@ -452,95 +372,8 @@ class TestingAgent(Agent):
 		x = pacman[0]
 		y = pacman[1]
 
-		# initialise dictionaries to hold expected utilities
-		self.util_dict = {"n_util": 0.0, "s_util": 0.0, "e_util": 0.0, "w_util": 0.0}
-
-		corners = api.corners(state)
-		maxWidth = self.getLayoutWidth(corners) - 1
-		maxHeight = self.getLayoutHeight(corners) - 1
-
-		# get directions relative to pacman's location
-		north = (x, y + 1)
-		south = (x, y - 1)
-		east = (x + 1, y)
-		west = (x - 1, y)
-		stay = (x, y)
-
-		# If North is not a wall, then multiply expected utility;
-		# else multiply expected utility of staying in place
-		# If the perpendicular directions are not walls, then multiply expected utility of those
-		# else multiply expected utility of just staying in place
-
-		if self.valueMap[north] != "#":
-			n_util = (0.8 * self.valueMap[north])
-		else:
-			n_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[east] != "#":
-			n_util += (0.1 * self.valueMap[east])
-		else:
-			n_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			n_util += (0.1 * self.valueMap[west])
-		else:
-			n_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["n_util"] = n_util
-
-
-		# Repeat for the rest of the directions
-		if self.valueMap[south] != "#":
-			s_util = (0.8 * self.valueMap[south])
-		else:
-			s_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[east] != "#":
-			s_util += (0.1 * self.valueMap[east])
-		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[west] != "#":
-			s_util += (0.1 * self.valueMap[west])
-		else:
-			s_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["s_util"] = s_util
-
-
-		if self.valueMap[east] != "#":
-			e_util = (0.8 * self.valueMap[east])
-		else:
-			e_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[north] != "#":
-			e_util += (0.1 * self.valueMap[north])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[south] != "#":
-			e_util += (0.1 * self.valueMap[south])
-		else:
-			e_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["e_util"] = e_util
-
-		if self.valueMap[west] != "#":
-			w_util = (0.8 * self.valueMap[west])
-		else:
-			w_util = (0.8 * self.valueMap[stay])
-
-		if self.valueMap[north] != "#":
-			w_util += (0.1 * self.valueMap[north])
-		else:
-			w_util += (0.1 * self.valueMap[stay])
-
-		if self.valueMap[south] != "#":
-			w_util += (0.1 * self.valueMap[south])
-		else:
-			w_util += (0.1 * self.valueMap[stay])
-
-		self.util_dict["w_util"] = w_util
+		# get the expected utilities of the moves from pacman's location
+		self.util_dict = self.getExpectedUtilities(self.valueMap, x, y)
 
 		# get max expected utility
 		maxMEU = max(self.util_dict.values())
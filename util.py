@@ -489,14 +489,16 @@ def nSample(distribution, values, n):
             cdf += distribution[distPos]
     return samples
 
-def sample(distribution, values = None):
+def sample(distribution, values = None, stream = None):
+    "stream: where to draw from (see randomStreams.py); by default the random module"
+    if stream is None: stream = random
     if type(distribution) == Counter:
         items = sorted(distribution.items())
         distribution = [i[1] for i in items]
         values = [i[0] for i in items]
     if sum(distribution) != 1:
         distribution = normalize(distribution)
-    choice = random.random()
+    choice = stream.random()
     i, total= 0, distribution[0]
     while choice > total:
         i += 1
@@ -522,11 +524,12 @@ def flipCoin( p ):
     r = random.random()
     return r < p
 
-def chooseFromDistribution( distribution ):
+def chooseFromDistribution( distribution, stream = None ):
     "Takes either a counter or a list of (prob, key) pairs and samples"
+    if stream is None: stream = random
     if type(distribution) == dict or type(distribution) == Counter:
-        return sample(distribution)
-    r = random.random()
+        return sample(distribution, stream = stream)
+    r = stream.random()
     base = 0.0
     for prob, element in distribution:
         base += prob
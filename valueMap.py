@@ -0,0 +1,123 @@
+# valueMap.py
+#
+# The utility map used by the MDP agents (MDPAgent, TestingAgent and
+# testAgent).
+#
+# The agents used to keep their utilities in a dictionary keyed by (x, y)
+# that held "#" on walls, so every backup built and hashed a handful of
+# coordinate tuples and compared values against "#". A ValueMap keeps the
+# utilities in one flat array of floats instead, with a boolean wall mask
+# alongside it. Squares are numbered column by column: (x, y) is entry
+# x * height + y, the same order LayoutModel in mdpSolver.py numbers its
+# free squares in.
+#
+# vm[(x, y)] still works (and gives "#" on walls) so code written for the
+# dictionaries carries on working. The solvers use the flat arrays and
+# the neighbour table directly.
+#
+# Only the standard library is used, so the dictionary solver still runs
+# without numpy.
+
+from array import array
+
+class ValueMap:
+
+	# width, height: size of the grid
+	# values:        array('d') of utilities, one per square (0 on walls)
+	# walls:         list of booleans, one per square, True on walls
+	# cells:         indices of the free squares, in order
+	# neighbours:    for each square, the indices of the squares north,
+	#                south, east and west of it, with a wall (or the edge
+	#                of the grid) replaced by the square itself. None on
+	#                walls
+	#
+	# walls, cells and neighbours only depend on the layout, so they are
+	# built once per layout and shared by every ValueMap on it.
+	def __init__(self, width, height, wallList=(), shape=None):
+		if shape is None:
+			shape = getShape(width, height, wallList)
+		self.width = width
+		self.height = height
+		self.walls, self.cells, self.neighbours = shape
+		self.values = array('d', [0.0]) * (width * height)
+
+	def indexOf(self, x, y):
+		# Index of square (x, y) in the flat arrays
+		return x * self.height + y
+
+	def coordinatesOf(self, i):
+		return divmod(i, self.height)
+
+	def isWall(self, x, y):
+		return self.walls[self.indexOf(x, y)]
+
+	def mask(self, cells):
+		# Returns a list of booleans, one per square, that is True for every
+		# (x, y) in cells. Positions that are not on a square (ghosts can
+		# be between two) or are off the grid are left out.
+		mask = [False] * (self.width * self.height)
+		for (x, y) in cells:
+			if x == int(x) and y == int(y) and 0 <= x < self.width and 0 <= y < self.height:
+				mask[self.indexOf(int(x), int(y))] = True
+		return mask
+
+	def copy(self):
+		# A copy of the utilities that shares the layout tables
+		other = ValueMap(self.width, self.height, shape=(self.walls, self.cells, self.neighbours))
+		other.values = array('d', self.values)
+		return other
+
+	# Dictionary-style access by (x, y), as the old valueMap dictionaries
+	def __getitem__(self, key):
+		x, y = key
+		if not (0 <= x < self.width and 0 <= y < self.height):
+			raise KeyError(key)
+		i = self.indexOf(x, y)
+		if self.walls[i]:
+			return "#"
+		return self.values[i]
+
+	def __setitem__(self, key, value):
+		x, y = key
+		if not (0 <= x < self.width and 0 <= y < self.height):
+			raise KeyError(key)
+		i = self.indexOf(x, y)
+		if self.walls[i]:
+			raise KeyError("(%d, %d) is a wall" % (x, y))
+		self.values[i] = value
+
+	def __contains__(self, key):
+		x, y = key
+		return 0 <= x < self.width and 0 <= y < self.height
+
+	def keys(self):
+		return [self.coordinatesOf(i) for i in range(self.width * self.height)]
+
+	def __len__(self):
+		return self.width * self.height
+
+# The layout tables of a ValueMap, looked up by the wall positions as
+# the game hands agents a fresh copy of the layout every move.
+_shapes = {}
+
+def getShape(width, height, wallList):
+	key = (width, height, tuple(wallList))
+	if key not in _shapes:
+		walls = [False] * (width * height)
+		for (x, y) in wallList:
+			walls[x * height + y] = True
+		cells = [i for i in range(width * height) if not walls[i]]
+
+		neighbours = [None] * (width * height)
+		for i in cells:
+			x, y = divmod(i, height)
+			moves = []
+			for (dx, dy) in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+				j = (x + dx) * height + y + dy
+				if 0 <= x + dx < width and 0 <= y + dy < height and not walls[j]:
+					moves.append(j)
+				else:
+					moves.append(i)
+			neighbours[i] = tuple(moves)
+		_shapes[key] = (walls, cells, neighbours)
+	return _shapes[key]